@@ -1,9 +1,11 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from math import floor, sqrt, copysign
 from mathutils import Vector, Quaternion, Matrix
 from numbers import Number
 from numpy.polynomial import polynomial as pl
 import numpy as np
+import os
 
 ZERO_ANIMWEIGHT_THRESH = 0.00001
 DELTA = 0.00001
@@ -306,6 +308,234 @@ def normalized(a, axis=-1, order=2):
     l2[l2 == 0] = 1
     return a / np.expand_dims(l2, axis)
 
+def union_find(num_items, a, b):
+    """
+    Joins pairs of item indices into disjoint sets using NumPy arrays.
+    Returns an array that maps each item to the lowest index in its set.
+    """
+
+    parent = np.arange(num_items)
+    a, b = np.asarray(a, dtype=parent.dtype), np.asarray(b, dtype=parent.dtype)
+    while True:
+        # Hook the larger root of each pair to the smaller one, then compress paths until flat
+        root_a, root_b = parent[a], parent[b]
+        if np.array_equal(root_a, root_b):
+            return parent
+        root_min = np.minimum(root_a, root_b)
+        np.minimum.at(parent, root_a, root_min)
+        np.minimum.at(parent, root_b, root_min)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+def find_close_pairs(points, distance):
+    """
+    Finds all pairs of points within a distance of each other, using a spatial hash.
+    Returns two arrays of point indices. Each pair is returned in both orders.
+    """
+
+    points = np.asarray(points, dtype=np.double).reshape(-1, 3)
+    cell_size = max(distance, SMALL_NUMBER)
+    cells = np.floor(points / cell_size).astype(np.int64)
+    hash_cells = lambda c: (c[:, 0] * 73856093) ^ (c[:, 1] * 19349663) ^ (c[:, 2] * 83492791)
+    order = np.argsort(hash_cells(cells), kind='stable')
+    sorted_keys = hash_cells(cells)[order]
+
+    # Look up the neighboring cells. Hash collisions only add candidates, distance is checked later
+    point_idxs = np.arange(len(points))
+    all_a, all_b = [], []
+    for offset in np.ndindex(3, 3, 3):
+        keys = hash_cells(cells + (np.array(offset) - 1))
+        starts = np.searchsorted(sorted_keys, keys, side='left')
+        counts = np.searchsorted(sorted_keys, keys, side='right') - starts
+        a = np.repeat(point_idxs, counts)
+        b = order[np.arange(len(a)) + np.repeat(starts - np.cumsum(counts) + counts, counts)]
+        all_a.append(a)
+        all_b.append(b)
+    a, b = np.concatenate(all_a), np.concatenate(all_b)
+
+    deltas = points[a] - points[b]
+    mask = (a != b) & (np.einsum('ij,ij->i', deltas, deltas) <= distance * distance)
+    pairs = np.unique(np.stack((a[mask], b[mask]), axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+def find_nearest_points(points, src_points, max_chunk_elements=1 << 22):
+    """
+    Finds the closest source point for each point by brute force, in chunks split across threads.
+    Meant for small sources such as curves. Returns an array of source indices and distances.
+    At most max_chunk_elements distances are held in memory at once, shared by all threads.
+    """
+
+    points = np.asarray(points, dtype=np.double).reshape(-1, 3)
+    src_points = np.asarray(src_points, dtype=np.double).reshape(-1, 3)
+    src_sq = np.einsum('ij,ij->i', src_points, src_points)
+    num_workers = os.cpu_count() or 1
+    chunk_size = max(1, max_chunk_elements // (num_workers * max(1, len(src_points))))
+
+    def find_chunk(start):
+        chunk = points[start:start+chunk_size]
+        dist_sq = chunk @ src_points.T
+        dist_sq *= -2.0
+        dist_sq += src_sq
+        idxs = np.argmin(dist_sq, axis=1)
+        dist_sq = dist_sq[np.arange(len(chunk)), idxs] + np.einsum('ij,ij->i', chunk, chunk)
+        return idxs, np.sqrt(np.maximum(dist_sq, 0.0))
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        results = list(executor.map(find_chunk, range(0, len(points), chunk_size)))
+    if not results:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    idxs, dists = zip(*results)
+    return np.concatenate(idxs), np.concatenate(dists)
+
+def calc_convex_hull_indices(points, max_verts=0, epsilon=1e-7):
+    """
+    Finds the vertices of the convex hull of a point cloud using quickhull.
+    The farthest point is added first on every step, so stopping early at max_verts gives the best
+    approximation for that budget. Returns indices into points. Flat inputs return every point.
+    """
+
+    points = np.asarray(points, dtype=np.double).reshape(-1, 3)
+    num_points = len(points)
+    if num_points < 4:
+        return np.arange(num_points)
+    eps = max(np.ptp(points, axis=0).max(), SMALL_NUMBER) * epsilon
+
+    def calc_planes(faces):
+        a, b, c = points[faces].transpose(1, 0, 2)
+        normals = np.cross(b - a, c - a)
+        normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), SMALL_NUMBER)
+        return normals, np.einsum('ij,ij->i', normals, a)
+
+    # Start with a tetrahedron of extreme points
+    i0 = np.argmin(points[:, 0])
+    i1 = np.argmax(np.linalg.norm(points - points[i0], axis=1))
+    i2 = np.argmax(np.linalg.norm(np.cross(points - points[i0], points[i1] - points[i0]), axis=1))
+    normal = np.cross(points[i1] - points[i0], points[i2] - points[i0])
+    normal_length = np.linalg.norm(normal)
+    if normal_length <= SMALL_NUMBER:
+        return np.arange(num_points)
+    i3 = np.argmax(np.abs((points - points[i0]) @ (normal / normal_length)))
+    if abs((points[i3] - points[i0]) @ normal) <= eps * normal_length:
+        return np.arange(num_points)
+    faces = np.array([[i0, i1, i2], [i0, i3, i1], [i0, i2, i3], [i1, i3, i2]])
+    normals, offsets = calc_planes(faces)
+    if normals[0] @ points[i3] - offsets[0] > 0.0:
+        # Wound inwards
+        faces = faces[:, ::-1]
+        normals, offsets = calc_planes(faces)
+    num_hull_verts = 4
+
+    # Each outside point is assigned to the face it's farthest from
+    dists = points @ normals.T - offsets
+    owner = np.argmax(dists, axis=1)
+    owner_dists = dists[np.arange(num_points), owner]
+    outside = owner_dists > eps
+    cand, cand_face, cand_dist = np.flatnonzero(outside), owner[outside], owner_dists[outside]
+
+    # Slots of removed faces are reused so the arrays only hold the current hull. A hull has at most
+    # 2N-4 faces. Free slots get an infinite offset so they're never visible
+    max_faces = 2 * num_points
+    faces = np.concatenate((faces, np.zeros((max_faces - 4, 3), dtype=faces.dtype)))
+    normals = np.concatenate((normals, np.zeros((max_faces - 4, 3))))
+    offsets = np.concatenate((offsets, np.full(max_faces - 4, np.inf)))
+    free_slots = np.empty(0, dtype=int)
+    num_slots = 4
+
+    while len(cand) and (max_verts <= 0 or num_hull_verts < max_verts):
+        eye_idx = cand[np.argmax(cand_dist)]
+        eye = points[eye_idx]
+        visible = np.flatnonzero(normals[:num_slots] @ eye - offsets[:num_slots] > eps)
+
+        # Horizon edges are those of visible faces whose twin isn't on a visible face
+        vis_faces = faces[visible]
+        edges = np.concatenate((vis_faces[:, [0, 1]], vis_faces[:, [1, 2]], vis_faces[:, [2, 0]]))
+        edge_keys = edges[:, 0] * num_points + edges[:, 1]
+        twin_keys = edges[:, 1] * num_points + edges[:, 0]
+        horizon = edges[~np.isin(twin_keys, edge_keys)]
+        new_faces = np.column_stack((horizon, np.full(len(horizon), eye_idx)))
+        new_normals, new_offsets = calc_planes(new_faces)
+        slots = np.concatenate((visible, free_slots))
+        num_new_slots = len(new_faces) - len(slots)
+        if num_new_slots > 0:
+            slots = np.concatenate((slots, np.arange(num_slots, num_slots + num_new_slots)))
+            num_slots += num_new_slots
+        slots, free_slots = slots[:len(new_faces)], slots[len(new_faces):]
+        offsets[free_slots] = np.inf
+        faces[slots] = new_faces
+        normals[slots] = new_normals
+        offsets[slots] = new_offsets
+        num_hull_verts += 1
+
+        # Points that belonged to removed faces are either outside a new face or inside the hull
+        is_visible = np.zeros(num_slots, dtype=bool)
+        is_visible[visible] = True
+        orphaned = is_visible[cand_face]
+        orphans = cand[orphaned & (cand != eye_idx)]
+        dists = points[orphans] @ new_normals.T - new_offsets
+        owner = np.argmax(dists, axis=1)
+        owner_dists = dists[np.arange(len(orphans)), owner]
+        outside = owner_dists > eps
+        cand = np.concatenate((cand[~orphaned], orphans[outside]))
+        cand_face = np.concatenate((cand_face[~orphaned], slots[owner[outside]]))
+        cand_dist = np.concatenate((cand_dist[~orphaned], owner_dists[outside]))
+
+    return np.unique(faces[:num_slots][np.isfinite(offsets[:num_slots])])
+
+def calc_barycentric(points, a, b, c):
+    """Barycentric coordinates of points on triangles (a, b, c). All arguments are arrays of shape (N, 3)."""
+
+    v0, v1, v2 = b - a, c - a, points - a
+    d00 = np.einsum('ij,ij->i', v0, v0)
+    d01 = np.einsum('ij,ij->i', v0, v1)
+    d11 = np.einsum('ij,ij->i', v1, v1)
+    d20 = np.einsum('ij,ij->i', v2, v0)
+    d21 = np.einsum('ij,ij->i', v2, v1)
+    denom = d00 * d11 - d01 * d01
+    degenerate = np.abs(denom) <= SMALL_NUMBER
+    denom[degenerate] = 1.0
+    v = (d11 * d20 - d01 * d21) / denom
+    w = (d00 * d21 - d01 * d20) / denom
+    v[degenerate] = w[degenerate] = 0.0  # Snap to the first corner
+    return np.stack((1.0 - v - w, v, w), axis=1)
+
+def calc_principal_axes(points):
+    """
+    Calculates the principal axes of an array of points with shape (N, 3).
+    Returns the mean and a 3x3 array whose rows are the axes, sorted by decreasing variance.
+    """
+    points = np.asarray(points, dtype=float)
+    mean = points.mean(axis=0)
+    _, _, axes = np.linalg.svd(points - mean, full_matrices=False)
+    if np.linalg.det(axes) < 0.0:
+        axes[2] *= -1.0  # Keep it right-handed so that it can be used as a rotation
+    return mean, axes
+
+def calc_bounding_sphere(points, max_iter=100):
+    """
+    Calculates a bounding sphere of an array of points with shape (N, 3) using Ritter's algorithm.
+    Returns the center and the radius. The result is usually a few percent larger than the minimal
+    sphere, but can be up to about 20% larger.
+    """
+    points = np.asarray(points, dtype=float)
+    a = points[np.argmax(((points - points[0]) ** 2).sum(axis=1))]
+    b = points[np.argmax(((points - a) ** 2).sum(axis=1))]
+    center = (a + b) * 0.5
+    radius = np.linalg.norm(b - a) * 0.5
+
+    # Grow towards the farthest outlier until every point is inside
+    for _ in range(max_iter):
+        dists = np.linalg.norm(points - center, axis=1)
+        idx = np.argmax(dists)
+        if dists[idx] <= radius * (1.0 + KINDA_SMALL_NUMBER):
+            break
+        new_radius = (radius + dists[idx]) * 0.5
+        center += (points[idx] - center) * ((new_radius - radius) / dists[idx])
+        radius = new_radius
+    return center, max(radius, np.linalg.norm(points - center, axis=1).max())
+
 def get_range_pct(min_value, max_value, value):
     """Calculates the percentage along a line from min_value to max_value."""
 
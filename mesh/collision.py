@@ -1,27 +1,31 @@
-from itertools import chain
-from math import pi, radians, sqrt, isclose
-from mathutils import Matrix, Vector
+from collections import namedtuple
+from math import pi, radians, isclose
+from mathutils import Euler, Matrix, Vector
 import bmesh
 import bpy
+import numpy as np
 import re
 
 from ..math import (
-    calc_best_fit_line,
+    calc_bounding_sphere,
+    calc_convex_hull_indices,
+    calc_principal_axes,
     get_dist_sq,
-    get_point_dist_to_line_sq,
-    get_range_pct,
 )
 from .helpers import clear_object_data
-from ..helpers import get_collection, instant_modifier
+from ..helpers import get_collection
 
 # make_collision TODO:
-# - Non-axis aligned boxes
-# - Symmetrize for convex isn't good
 # - Wall collision should try to decompose into boxes
 # - Convex decomposition with v-hacd?
 
 collision_prefixes = ('UCX', 'UBX', 'UCP', 'USP')
 
+# Operator properties that are fitted to each object
+ShapeParams = namedtuple('ShapeParams', ('location', 'aabb_width', 'aabb_height', 'aabb_depth',
+    'aabb_rotation', 'cyl_radius1', 'cyl_radius2', 'cyl_height', 'cyl_rotation', 'cap_radius',
+    'cap_depth', 'cap_rotation', 'sph_radius', 'sph_location'))
+
 def get_collision_objects(context, obj):
     pattern = r"^(?:%s)_%s_\d+$" % ('|'.join(collision_prefixes), obj.name)
     return [o for o in context.scene.objects if re.match(pattern, o.name)]
@@ -31,7 +35,8 @@ def find_free_col_name(prefix, name):
     while True:
         col_name = f"{prefix}_{name}_{n}"
         n += 1
-        if col_name not in bpy.context.scene.objects:
+        # Check all objects, batch results are linked to the scene after they're all created
+        if col_name not in bpy.context.scene.objects and col_name not in bpy.data.objects:
             break
     return col_name
 
@@ -178,6 +183,11 @@ class GRET_OT_collision_make(bpy.types.Operator):
         subtype='TRANSLATION',
         size=3,
     )
+    all_selected: bpy.props.BoolProperty(
+        name="All Selected",
+        description="Fit and generate collision for every selected mesh (object mode only)",
+        default=False,
+    )
 
     # AABB settings
     aabb_width: bpy.props.FloatProperty(
@@ -198,6 +208,12 @@ class GRET_OT_collision_make(bpy.types.Operator):
         subtype='DISTANCE',
         min=0.001,
     )
+    aabb_rotation: bpy.props.FloatVectorProperty(
+        name="Rotation",
+        description="Bounding box rotation",
+        subtype='EULER',
+        size=3,
+    )
 
     # Cylinder settings
     cyl_caps: bpy.props.BoolProperty(
@@ -233,6 +249,12 @@ class GRET_OT_collision_make(bpy.types.Operator):
         subtype='DISTANCE',
         min=0.001,
     )
+    cyl_rotation: bpy.props.FloatVectorProperty(
+        name="Rotation",
+        description="Cylinder rotation",
+        subtype='EULER',
+        size=3,
+    )
 
     # Capsule settings
     cap_radius: bpy.props.FloatProperty(
@@ -261,6 +283,12 @@ class GRET_OT_collision_make(bpy.types.Operator):
         subtype='DISTANCE',
         min=0.001,
     )
+    sph_location: bpy.props.FloatVectorProperty(
+        name="Location",
+        description="Sphere location",
+        subtype='TRANSLATION',
+        size=3,
+    )
 
     # Convex settings
     planar_angle: bpy.props.FloatProperty(
@@ -274,11 +302,19 @@ class GRET_OT_collision_make(bpy.types.Operator):
     )
     decimate_ratio: bpy.props.FloatProperty(
         name="Decimate Ratio",
-        description="Percentage of edges to collapse",
+        description="Deprecated, use Max Vertices. Fraction of hull vertices to keep if there's no limit",
         subtype='FACTOR',
         default=1.0,
         min=0.0,
         max=1.0,
+        options={'HIDDEN'},
+    )
+    max_verts: bpy.props.IntProperty(
+        name="Max Vertices",
+        description="Maximum number of hull vertices, farthest points are kept first. Zero for no limit",
+        default=0,
+        min=0,
+        soft_max=256,
     )
     use_symmetry: bpy.props.BoolProperty(
         name="Symmetry",
@@ -319,8 +355,7 @@ class GRET_OT_collision_make(bpy.types.Operator):
 
         parent = None
         if self.output == 'COLLECTION' and self.collection:
-            collection = get_collection(context, self.collection, allow_duplicate=True, clean=False)
-            collection.color_tag = 'COLOR_04'
+            collection = self.output_collection
         elif self.output in 'CHILD':
             collection = obj.users_collection[0]
             parent = obj
@@ -338,7 +373,7 @@ class GRET_OT_collision_make(bpy.types.Operator):
         col_obj.display.show_shadows = False
         # bmeshes created with from_mesh or from_object may have some UVs or customdata
         clear_object_data(col_obj)
-        collection.objects.link(col_obj)
+        self.col_objs_to_link.append((collection, col_obj))
 
         return col_obj
 
@@ -351,8 +386,10 @@ class GRET_OT_collision_make(bpy.types.Operator):
         bm.verts.ensure_lookup_table()
         bm.normal_update()
 
+        # Scratch bmesh reused for every face
+        bm2 = bmesh.new()
         for face in bm.faces:
-            bm2 = bmesh.new()
+            bm2.clear()
 
             # Add new vertices
             verts1, verts2 = [], []
@@ -373,11 +410,11 @@ class GRET_OT_collision_make(bpy.types.Operator):
             bm2.faces.new(verts2)
 
             self.create_col_object_from_bm(context, obj, bm2, mat)
-            bm2.free()
+        bm2.free()
 
-    def make_aabb_collision(self, context, obj):
-        mat = Matrix.Translation(self.location)
-        half_extents = Vector((self.aabb_depth, self.aabb_width, self.aabb_height)) * 0.5
+    def make_aabb_collision(self, context, obj, params):
+        mat = Matrix.Translation(params.location) @ params.aabb_rotation.to_matrix().to_4x4()
+        half_extents = Vector((params.aabb_depth, params.aabb_width, params.aabb_height)) * 0.5
 
         bm = bmesh.new()
         verts = bmesh.ops.create_cube(bm, calc_uvs=False)['verts']
@@ -395,69 +432,113 @@ class GRET_OT_collision_make(bpy.types.Operator):
             self.create_col_object_from_bm(context, obj, bm, mat)
         bm.free()
 
-    def make_cylinder_collision(self, context, obj):
-        mat = Matrix.Translation(self.location)
+    def make_cylinder_collision(self, context, obj, params):
+        mat = Matrix.Translation(params.location) @ params.cyl_rotation.to_matrix().to_4x4()
         if self.cyl_rotate:
             mat @= Matrix.Rotation(pi / self.cyl_sides, 4, 'Z')
 
         bm = bmesh.new()
         cap_ends = not self.hollow or self.cyl_caps
         bmesh.ops.create_cone(bm, cap_ends=cap_ends, cap_tris=False, segments=self.cyl_sides,
-            radius1=self.cyl_radius1, radius2=self.cyl_radius2, depth=self.cyl_height, calc_uvs=False)
+            radius1=params.cyl_radius1, radius2=params.cyl_radius2, depth=params.cyl_height,
+            calc_uvs=False)
         if self.hollow:
             self.create_split_col_object_from_bm(context, obj, bm, mat, self.thickness, self.offset)
         else:
             self.create_col_object_from_bm(context, obj, bm, mat)
         bm.free()
 
-    def make_capsule_collision(self, context, obj):
+    def make_capsule_collision(self, context, obj, params):
         bm_mat = Matrix.Rotation(pi * 0.5, 4, 'X')
-        mat = Matrix.Translation(self.location) @ self.cap_rotation.to_matrix().to_4x4() @ bm_mat
+        mat = Matrix.Translation(params.location) @ params.cap_rotation.to_matrix().to_4x4() @ bm_mat
 
         bm = bmesh.new()
-        bmesh.ops.create_cone(bm, cap_ends=True, cap_tris=False, segments=8, radius1=self.cap_radius,
-            radius2=self.cap_radius, depth=self.cap_depth, calc_uvs=False, matrix=bm_mat)
+        bmesh.ops.create_cone(bm, cap_ends=True, cap_tris=False, segments=8,
+            radius1=params.cap_radius, radius2=params.cap_radius, depth=params.cap_depth,
+            calc_uvs=False, matrix=bm_mat)
         bm.faces.ensure_lookup_table()
         caps = [bm.faces[-1], bm.faces[-4]]
-        bmesh.ops.poke(bm, faces=caps, offset=self.cap_radius)
+        bmesh.ops.poke(bm, faces=caps, offset=params.cap_radius)
         self.create_col_object_from_bm(context, obj, bm, mat, prefix='UCP')
         bm.free()
 
-    def make_sphere_collision(self, context, obj):
-        mat = Matrix.Translation(self.location)
+    def make_sphere_collision(self, context, obj, params):
+        mat = Matrix.Translation(params.sph_location)
 
         bm = bmesh.new()
-        bmesh.ops.create_icosphere(bm, subdivisions=2, radius=self.sph_radius*0.5, calc_uvs=False)
+        bmesh.ops.create_icosphere(bm, subdivisions=2, radius=params.sph_radius, calc_uvs=False)
         self.create_col_object_from_bm(context, obj, bm, mat, prefix='USP')
         bm.free()
 
-    def make_convex_collision(self, context, obj):
-        if context.mode == 'EDIT_MESH':
-            bm = bmesh.from_edit_mesh(obj.data).copy()
-            bm.verts.ensure_lookup_table()
-            bmesh.ops.delete(bm, geom=[v for v in bm.verts if not v.select], context='VERTS')
+    def get_vert_coords(self, context, obj):
+        """Returns selected vertex coordinates in edit mode, otherwise all evaluated coordinates."""
+
+        if obj.mode == 'EDIT':
+            obj.update_from_editmode()
+            mesh = obj.data
+            coords = np.empty(len(mesh.vertices) * 3, dtype=np.single)
+            mesh.vertices.foreach_get('co', coords)
+            selected = np.empty(len(mesh.vertices), dtype=bool)
+            mesh.vertices.foreach_get('select', selected)
+            return coords.reshape(-1, 3)[selected]
         else:
-            bm = bmesh.new()
             dg = context.evaluated_depsgraph_get()
-            bm.from_object(obj, dg)
+            obj_eval = obj.evaluated_get(dg)
+            mesh = obj_eval.to_mesh()
+            coords = np.empty(len(mesh.vertices) * 3, dtype=np.single)
+            mesh.vertices.foreach_get('co', coords)
+            obj_eval.to_mesh_clear()
+            return coords.reshape(-1, 3)
 
-        # Clean incoming mesh
-        bm.edges.ensure_lookup_table()
-        for edge in bm.edges:
-            edge.seam = False
-            edge.smooth = True
-        bm.faces.ensure_lookup_table()
-        for face in bm.faces:
-            face.smooth = False
+    def make_convex_collision(self, context, obj):
+        coords = self.get_vert_coords(context, obj)
+        if len(coords) < 3:
+            self.report({'WARNING'}, f"Can't make convex collision for {obj.name}, too few vertices.")
+            return
+
+        max_verts = max(4, self.max_verts) if self.max_verts > 0 else 0
+        if max_verts <= 0 and self.decimate_ratio < 1.0:
+            # Old presets and redo data only have a ratio, turn it into a vertex budget
+            hull_idxs = calc_convex_hull_indices(coords)
+            max_verts = max(4, round(len(hull_idxs) * self.decimate_ratio))
+            if not self.use_symmetry:
+                # Points are picked farthest first, so picking from the hull alone gives the same result
+                coords = coords[hull_idxs]
+
+        if self.use_symmetry:
+            # Like symmetrize, mirror the positive side over the center of the bounds
+            axis_idx = ('X', 'Y', 'Z').index(self.symmetry_axis)
+            center = (coords[:, axis_idx].min() + coords[:, axis_idx].max()) * 0.5
+            coords = coords[coords[:, axis_idx] >= center]
+            half_verts = (max_verts + 1) // 2 if max_verts > 0 else 0
+            while True:
+                half_coords = coords
+                if half_verts > 0:
+                    half_coords = coords[calc_convex_hull_indices(coords, half_verts)]
+                # Points on the plane would mirror onto themselves, don't duplicate them
+                off_plane = half_coords[:, axis_idx] - center > 1e-5
+                mirrored_coords = half_coords[off_plane]
+                mirrored_coords[:, axis_idx] = center * 2.0 - mirrored_coords[:, axis_idx]
+                if max_verts <= 0 or len(half_coords) + len(mirrored_coords) <= max_verts:
+                    break
+                if half_verts <= 4:
+                    break  # Can't go below a tetrahedron per side
+                half_verts -= 1
+            coords = np.concatenate((half_coords, mirrored_coords))
+        elif max_verts > 0:
+            # Pick the hull vertices in advance, a full hull would need decimating afterwards
+            coords = coords[calc_convex_hull_indices(coords, max_verts)]
+
+        if len(coords) < 3:
+            self.report({'WARNING'}, f"Can't make convex collision for {obj.name}, too few vertices.")
+            return
 
-        # While convex_hull works only on verts, pass all the geometry so that it gets tagged
-        geom = list(chain(bm.verts, bm.edges, bm.faces))
-        result = bmesh.ops.convex_hull(bm, input=geom, use_existing_faces=True)
+        bm = bmesh.new()
+        for co in coords.tolist():
+            bm.verts.new(co)
+        result = bmesh.ops.convex_hull(bm, input=list(bm.verts), use_existing_faces=False)
         # geom_interior: elements that ended up inside the hull rather than part of it
-        # geom_unused: elements that ended up inside the hull and are are unused by other geometry
-        # The two sets may intersect, so for now just delete one of them. I haven't found a case yet
-        # where this leaves out unwanted geometry
-        bmesh.ops.delete(bm, geom=result['geom_interior'], context='TAGGED_ONLY')
+        bmesh.ops.delete(bm, geom=result['geom_interior'], context='VERTS')
         bm.normal_update()
         bmesh.ops.dissolve_limit(bm, angle_limit=self.planar_angle,
             verts=bm.verts, edges=bm.edges, use_dissolve_boundaries=False, delimit=set())
@@ -465,105 +546,140 @@ class GRET_OT_collision_make(bpy.types.Operator):
         median = sum((vert.co for vert in bm.verts), Vector()) / len(bm.verts)
         bmesh.ops.translate(bm, verts=bm.verts, vec=-median)
         mat = Matrix.Translation(median)
-        col_obj = self.create_col_object_from_bm(context, obj, bm, mat, prefix='UCX')
+        self.create_col_object_from_bm(context, obj, bm, mat, prefix='UCX')
         bm.free()
 
-        # Decimate (no bmesh op for this currently?)
-        with instant_modifier(col_obj, type='DECIMATE') as decimate_mod:
-            decimate_mod.ratio = self.decimate_ratio
-            decimate_mod.use_symmetry = self.use_symmetry
-            decimate_mod.symmetry_axis = self.symmetry_axis
-
     def execute(self, context):
         obj = context.active_object
+        if self.all_selected and obj.mode != 'EDIT':
+            objs = [o for o in context.selected_objects if o.type == 'MESH'
+                and not o.name[:3] in collision_prefixes]
+        else:
+            objs = [obj]
+
+        self.output_collection = None
+        if self.output == 'COLLECTION' and self.collection:
+            self.output_collection = get_collection(context, self.collection,
+                allow_duplicate=True, clean=False)
+            self.output_collection.color_tag = 'COLOR_04'
+        self.col_objs_to_link = []
 
         if obj.mode != 'EDIT':
             # When working from object mode, it follows that there should be only one collision shape
-            pattern = re.compile(rf"^U[A-Z][A-Z]_{obj.name}_\d+")
-            for mesh in [mesh for mesh in bpy.data.meshes if pattern.match(mesh.name)]:
+            patterns = [re.compile(rf"^U[A-Z][A-Z]_{re.escape(o.name)}_\d+") for o in objs]
+            for mesh in [mesh for mesh in bpy.data.meshes if any(p.match(mesh.name) for p in patterns)]:
                 bpy.data.meshes.remove(mesh)
 
-        if self.shape == 'AABB':
-            self.make_aabb_collision(context, obj)
-        elif self.shape == 'CYLINDER':
-            self.make_cylinder_collision(context, obj)
-        elif self.shape == 'CAPSULE':
-            self.make_capsule_collision(context, obj)
-        elif self.shape == 'SPHERE':
-            self.make_sphere_collision(context, obj)
-        elif self.shape == 'CONVEX':
-            self.make_convex_collision(context, obj)
+        # Parameters in the dialog belong to the active object, others are fitted separately
+        # Operator properties are left alone so that redo shows the active object's values
+        active_obj = context.active_object
+        active_params = ShapeParams(*(getattr(self, name) for name in ShapeParams._fields))
+        for obj in objs:
+            if obj == active_obj or self.shape == 'CONVEX':
+                params = active_params
+            else:
+                try:
+                    params = self.calculate_parameters(context, obj)
+                except RuntimeError as e:
+                    self.report({'WARNING'}, f"Can't make collision for {obj.name}: {e}")
+                    continue
+
+            if self.shape == 'AABB':
+                self.make_aabb_collision(context, obj, params)
+            elif self.shape == 'CYLINDER':
+                self.make_cylinder_collision(context, obj, params)
+            elif self.shape == 'CAPSULE':
+                self.make_capsule_collision(context, obj, params)
+            elif self.shape == 'SPHERE':
+                self.make_sphere_collision(context, obj, params)
+            elif self.shape == 'CONVEX':
+                self.make_convex_collision(context, obj)
+
+        # Link everything at the end, in one pass
+        for collection, col_obj in self.col_objs_to_link:
+            collection.objects.link(col_obj)
+        self.col_objs_to_link.clear()
 
         return {'FINISHED'}
 
     def invoke(self, context, event):
         # Calculate initial properties
         try:
-            self.calculate_parameters(context, context.object)
+            params = self.calculate_parameters(context, context.object)
         except RuntimeError as e:
             self.report({'ERROR'}, str(e))
             return {'CANCELLED'}
+        for name, value in params._asdict().items():
+            setattr(self, name, value)
 
         # Ideally this would execute once then show the popup dialog, doesn't seem possible
         return context.window_manager.invoke_props_dialog(self)
 
     def calculate_parameters(self, context, obj):
-        if obj.mode == 'EDIT':
-            bm = bmesh.from_edit_mesh(obj.data)
-            vert_cos = [vert.co for vert in bm.verts if vert.select]
-        else:
-            dg = context.evaluated_depsgraph_get()
-            obj_eval = obj.evaluated_get(dg)
-            vert_cos = [vert.co for vert in obj_eval.data.vertices]
-        if len(vert_cos) < 3:
+        """Fits every shape to the vertices of an object. Returns ShapeParams."""
+
+        coords = self.get_vert_coords(context, obj).astype(float)
+        if len(coords) < 3:
             raise RuntimeError("Requires at least three vertices")
 
-        axis, _ = calc_best_fit_line(vert_cos)
-
-        corner1 = vert_cos[0].copy()
-        corner2 = vert_cos[1].copy()
-        for co in vert_cos:
-            corner1.x = min(corner1.x, co.x)
-            corner1.y = min(corner1.y, co.y)
-            corner1.z = min(corner1.z, co.z)
-            corner2.x = max(corner2.x, co.x)
-            corner2.y = max(corner2.y, co.y)
-            corner2.z = max(corner2.z, co.z)
-
-        # Bounding box dimensions
-        self.aabb_depth = abs(corner1.x - corner2.x)
-        self.aabb_width = abs(corner1.y - corner2.y)
-        self.aabb_height = abs(corner1.z - corner2.z)
-        self.location = center = (corner1 + corner2) * 0.5
-
-        # Cylinder radius
-        self.cyl_radius1 = self.cyl_radius2 = 0.001
-        for co in vert_cos:
-            dx = center.x - co.x
-            dy = center.y - co.y
-            d = sqrt(dx * dx + dy * dy)
-            influence2 = get_range_pct(corner1.z, corner2.z, co.z)
-            influence1 = 1.0 - influence2
-            self.cyl_radius1 = max(self.cyl_radius1, d * influence1)
-            self.cyl_radius2 = max(self.cyl_radius2, d * influence2)
-        self.cyl_height = self.aabb_height
-
-        # Capsule axis and radius
-        radius_sq = 0.001
-        depth_sq = 0.0
-        for co in vert_cos:
-            dist_to_axis_sq = get_point_dist_to_line_sq(co, axis, center)
-            if dist_to_axis_sq > radius_sq:
-                radius_sq = dist_to_axis_sq
-            dist_along_axis_sq = (co - center).project(axis).length_squared
-            if dist_along_axis_sq > depth_sq:
-                depth_sq = dist_along_axis_sq
-        self.cap_radius = sqrt(radius_sq)
-        self.cap_rotation = axis.to_track_quat('Z', 'X').to_euler('XYZ')
-        self.cap_depth = sqrt(depth_sq) * 2.0 - self.cap_radius
-
-        # Sphere radius
-        self.sph_radius = max(self.aabb_depth, self.aabb_width, self.aabb_height)
+        _, axes = calc_principal_axes(coords)
+
+        # Bounding box, oriented to the principal axes only if it's noticeably tighter
+        box_axes = np.identity(3)
+        corner1, corner2 = coords.min(axis=0), coords.max(axis=0)
+        local_coords = coords @ axes.T
+        obb_corner1, obb_corner2 = local_coords.min(axis=0), local_coords.max(axis=0)
+        if np.prod(obb_corner2 - obb_corner1) < np.prod(corner2 - corner1) * 0.95:
+            box_axes, corner1, corner2 = axes, obb_corner1, obb_corner2
+        aabb_depth, aabb_width, aabb_height = np.maximum(corner2 - corner1, 0.001)
+        aabb_rotation = Matrix(box_axes.T.tolist()).to_euler('XYZ')
+        center = ((corner1 + corner2) * 0.5) @ box_axes
+        offsets = coords - center
+
+        # Cylinder, try the Z axis then the principal axes and keep the smallest
+        best_volume = np.inf
+        for axis_idx, axis in enumerate(np.vstack(((0.0, 0.0, 1.0), axes))):
+            heights = offsets @ axis
+            dists = np.linalg.norm(offsets - np.outer(heights, axis), axis=1)
+            half_height = np.abs(heights).max()
+            influence2 = np.clip((heights + half_height) / max(half_height * 2.0, 1e-8), 0.0, 1.0)
+            radius1 = max(0.001, (dists * (1.0 - influence2)).max())
+            radius2 = max(0.001, (dists * influence2).max())
+            volume = half_height * (radius1 * radius1 + radius1 * radius2 + radius2 * radius2)
+            if volume < best_volume * 0.95:
+                best_volume = volume
+                cyl_radius1, cyl_radius2 = radius1, radius2
+                cyl_height = max(0.001, half_height * 2.0)
+                cyl_rotation = Euler() if axis_idx == 0 else \
+                    Vector(axis).to_track_quat('Z', 'X').to_euler('XYZ')
+
+        # Capsule along the principal axis
+        axis = axes[0]
+        heights = offsets @ axis
+        dists = np.linalg.norm(offsets - np.outer(heights, axis), axis=1)
+        cap_radius = max(0.001, dists.max())
+        cap_rotation = Vector(axis).to_track_quat('Z', 'X').to_euler('XYZ')
+        cap_depth = max(0.001, np.abs(heights).max() * 2.0 - cap_radius)
+
+        # Sphere
+        sph_location, sph_radius = calc_bounding_sphere(coords)
+
+        return ShapeParams(
+            location=Vector(center),
+            aabb_width=aabb_width,
+            aabb_height=aabb_height,
+            aabb_depth=aabb_depth,
+            aabb_rotation=aabb_rotation,
+            cyl_radius1=cyl_radius1,
+            cyl_radius2=cyl_radius2,
+            cyl_height=cyl_height,
+            cyl_rotation=cyl_rotation,
+            cap_radius=cap_radius,
+            cap_depth=cap_depth,
+            cap_rotation=cap_rotation,
+            sph_radius=max(0.001, sph_radius),
+            sph_location=Vector(sph_location),
+        )
 
     def draw(self, context):
         layout = self.layout
@@ -576,6 +692,7 @@ class GRET_OT_collision_make(bpy.types.Operator):
         col.prop(self, 'output')
         if self.output == 'COLLECTION':
             col.prop(self, 'collection')
+        col.prop(self, 'all_selected')
 
         if self.shape in {'AABB', 'CYLINDER'}:
             col.separator()
@@ -602,7 +719,7 @@ class GRET_OT_collision_make(bpy.types.Operator):
             col.prop(self, 'sph_radius')
         elif self.shape == 'CONVEX':
             col.prop(self, 'planar_angle')
-            col.prop(self, 'decimate_ratio')
+            col.prop(self, 'max_verts')
             row = col.row(align=True, heading="Symmetrize")
             row.prop(self, 'use_symmetry', text="")
             row.prop(self, 'symmetry_axis', expand=True)
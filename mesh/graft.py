@@ -1,11 +1,18 @@
+from collections import namedtuple
 from itertools import dropwhile, chain
 from math import pi
+from mathutils.bvhtree import BVHTree
 import bmesh
 import bpy
 import numpy as np
 
-from ..math import get_dist_sq
-from .helpers import edit_mesh_elements, bmesh_vertex_group_bleed, get_face_map_attribute
+from ..math import calc_barycentric
+from .helpers import (
+    bmesh_vertex_group_bleed,
+    get_face_map_attribute,
+    get_shape_key_coords,
+    get_vertex_group_weights,
+)
 from ..helpers import with_object, with_objects, get_modifier, get_vgroup, select_only, instant_modifier
 from ..operator import SaveContext
 
@@ -14,13 +21,107 @@ from ..operator import SaveContext
 class GraftError(Exception):
     pass
 
+TargetData = namedtuple('TargetData', 'coords tris tri_faces bvh')
+
+def get_target_data(obj, cache=None):
+    """
+    Returns vertex coordinates, loop triangles with their face indices, and a BVH tree of a mesh.
+    Pass the same cache dict to reuse them while the mesh doesn't change.
+    """
+
+    key = (obj.name, 'TARGET_DATA')
+    if cache is not None and key in cache:
+        return cache[key]
+
+    mesh = obj.data
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.single)
+    mesh.vertices.foreach_get('co', coords)
+    coords = coords.reshape(-1, 3)
+    if hasattr(mesh, 'calc_loop_triangles'):
+        mesh.calc_loop_triangles()
+    tris = np.empty(len(mesh.loop_triangles) * 3, dtype=np.intc)
+    mesh.loop_triangles.foreach_get('vertices', tris)
+    tris = tris.reshape(-1, 3)
+    tri_faces = np.empty(len(mesh.loop_triangles), dtype=np.intc)
+    mesh.loop_triangles.foreach_get('polygon_index', tri_faces)
+    bvh = BVHTree.FromPolygons(coords.tolist(), tris.tolist(), all_triangles=True)
+
+    target_data = TargetData(coords, tris, tri_faces, bvh)
+    if cache is not None:
+        cache[key] = target_data
+    return target_data
+
+def _get_shape_key_deltas(obj):
+    """Returns the basis name and a list of (name, deltas) for the shape keys of a mesh."""
+
+    mesh = obj.data
+    num_verts = len(mesh.vertices)
+    key_blocks = mesh.shape_keys.key_blocks
+    basis_coords = get_shape_key_coords(key_blocks[0], num_verts).reshape(-1, 3)
+    return key_blocks[0].name, [(sk.name, get_shape_key_coords(sk, num_verts).reshape(-1, 3)
+        - basis_coords) for sk in key_blocks[1:]]
+
+def transfer_shape_keys(obj, from_obj, vertex_group_index, cache=None, key_obj=None):
+    """
+    Interpolates shape keys from the nearest surface of another mesh, using barycentric coordinates.
+    Deltas are weighted by the given vertex group and added to existing shape keys of the same name.
+    key_obj is where shape keys are read from, it must have the same vertices as from_obj.
+    Pass the same cache dict when transferring from the same mesh many times.
+    """
+
+    mesh = obj.data
+    key_obj = key_obj or from_obj
+    key_mesh = key_obj.data
+    if not key_mesh.shape_keys or len(key_mesh.shape_keys.key_blocks) <= 1:
+        return
+    weights = get_vertex_group_weights(obj, vertex_group_index)
+    vert_idxs = np.flatnonzero(weights > 0.0)
+    if not len(vert_idxs):
+        return
+
+    if cache is None:
+        cache = {}
+    from_coords, tris, _, bvh = get_target_data(from_obj, cache)
+    if not len(tris):
+        return
+    key = (key_obj.name, 'SHAPE_KEY_DELTAS')
+    if key not in cache:
+        cache[key] = _get_shape_key_deltas(key_obj)
+    from_basis_name, from_deltas = cache[key]
+
+    # Find the nearest triangle for every weighted vertex. BVHTree has no batch query
+    num_verts = len(mesh.vertices)
+    obj_to_from = np.array(from_obj.matrix_world.inverted() @ obj.matrix_world)
+    coords = np.empty(num_verts * 3, dtype=np.single)
+    mesh.vertices.foreach_get('co', coords)
+    coords = coords.reshape(-1, 3)[vert_idxs] @ obj_to_from[:3, :3].T + obj_to_from[:3, 3]
+    nearest = [bvh.find_nearest(co) for co in coords.tolist()]
+    nearest_coords = np.array([loc for loc, _, _, _ in nearest])
+    tri_verts = tris[np.array([tri_idx for _, _, tri_idx, _ in nearest])]
+    bary = calc_barycentric(nearest_coords, *from_coords[tri_verts].transpose(1, 0, 2))
+    bary *= weights[vert_idxs, np.newaxis]
+
+    from_to_obj = np.linalg.inv(obj_to_from[:3, :3])
+    if not mesh.shape_keys:
+        obj.shape_key_add(name=from_basis_name, from_mix=False)
+    for from_sk_name, deltas in from_deltas:
+        sk = mesh.shape_keys.key_blocks.get(from_sk_name)
+        if not sk:
+            sk = obj.shape_key_add(name=from_sk_name, from_mix=False)
+        sk_coords = get_shape_key_coords(sk, num_verts).reshape(-1, 3)
+        sk_coords[vert_idxs] += np.einsum('ij,ijk->ik', bary, deltas[tri_verts]) @ from_to_obj.T
+        sk.data.foreach_set('co', sk_coords.ravel())
+
 def do_graft(context, save, obj, dst_obj, expand=0, cuts=0, blend_distance=0.0, blend_power=0.0,
-    face_map_name="", copy_normals=False, copy_vertex_groups=False, copy_uv_layers=False):
+    face_map_name="", copy_normals=False, copy_vertex_groups=False, copy_uv_layers=False,
+    copy_shape_keys=False, shape_key_obj=None, cache=None):
     """Bridge the open boundary of a source mesh with a target mesh.
-    Returns (vertex indices, face indices) of the intersection on the target mesh."""
+    Returns (vertex indices, face indices, boundary vertex indices) of the intersection on the target mesh."""
 
     # Initial setup
     dst_mesh = dst_obj.data
+    if not dst_mesh.polygons:
+        raise GraftError("Target has no faces.")
     obj_to_world = obj.matrix_world.copy()
     world_to_obj = obj.matrix_world.inverted()
     dst_to_obj = world_to_obj @ dst_obj.matrix_world
@@ -54,42 +155,75 @@ def do_graft(context, save, obj, dst_obj, expand=0, cuts=0, blend_distance=0.0,
     bool_mod.solver = 'FAST'
     bool_mod.object = dst_obj
     dg = context.evaluated_depsgraph_get()
-    bool_bm = bmesh.new()
-    bool_bm.from_object(obj, dg)
+    obj_eval = obj.evaluated_get(dg)
+    bool_mesh = obj_eval.to_mesh()
+    bool_centers = np.empty(len(bool_mesh.polygons) * 3, dtype=np.single)
+    bool_mesh.polygons.foreach_get('center', bool_centers)
+    obj_eval.to_mesh_clear()
     obj.modifiers.remove(bool_mod)
     obj.modifiers.remove(wrap_mod)
 
     # Because the result of the boolean operation mostly matches the destination geometry,
     # all that's needed is finding those same faces in the original mesh
-    intersection_face_indices = []
-    for face in bool_bm.faces:
-        p = obj_to_dst @ face.calc_center_median()
-        result, closest_point, normal, face_idx = dst_obj.closest_point_on_mesh(p)
-        if result:
-            if get_dist_sq(p, dst_mesh.polygons[face_idx].center) <= 0.05:
-                intersection_face_indices.append(face_idx)
-    bool_bm.free()
-    del bool_bm
-
-    if not intersection_face_indices:
+    obj_to_dst_np = np.array(obj_to_dst)
+    bool_centers = bool_centers.reshape(-1, 3) @ obj_to_dst_np[:3, :3].T + obj_to_dst_np[:3, 3]
+    dst_data = get_target_data(dst_obj, cache)
+    find_nearest = dst_data.bvh.find_nearest
+    nearest_tri_idxs = (find_nearest(co)[2] for co in bool_centers.tolist())
+    nearest_tri_idxs = np.fromiter((-1 if idx is None else idx for idx in nearest_tri_idxs),
+        dtype=np.intp, count=len(bool_centers))
+    found = nearest_tri_idxs >= 0
+    bool_centers, nearest_face_idxs = bool_centers[found], dst_data.tri_faces[nearest_tri_idxs[found]]
+    dst_centers = np.empty(len(dst_mesh.polygons) * 3, dtype=np.single)
+    dst_mesh.polygons.foreach_get('center', dst_centers)
+    dst_centers = dst_centers.reshape(-1, 3)
+    deltas = bool_centers - dst_centers[nearest_face_idxs]
+    mask = np.einsum('ij,ij->i', deltas, deltas) <= 0.05
+    intersection_face_indices = np.unique(nearest_face_idxs[mask])
+
+    if not len(intersection_face_indices):
         bm.free()
         raise GraftError("No intersection found.")
 
     # The target edge loop is the boundary of the intersection. Recreate it in working bmesh.
-    # This part takes a while, could use some optimization
-    edit_mesh_elements(dst_obj, 'FACE', indices=intersection_face_indices)
+    # Same as select_more and region_to_loop, without going through edit mode
+    num_dst_faces = len(dst_mesh.polygons)
+    loop_totals = np.empty(num_dst_faces, dtype=np.intc)
+    dst_mesh.polygons.foreach_get('loop_total', loop_totals)
+    loop_faces = np.repeat(np.arange(num_dst_faces), loop_totals)
+    loop_verts = np.empty(len(dst_mesh.loops), dtype=np.intc)
+    dst_mesh.loops.foreach_get('vertex_index', loop_verts)
+    loop_edges = np.empty(len(dst_mesh.loops), dtype=np.intc)
+    dst_mesh.loops.foreach_get('edge_index', loop_edges)
+
+    face_selected = np.zeros(num_dst_faces, dtype=bool)
+    face_selected[intersection_face_indices] = True
     for _ in range(expand):
-        bpy.ops.mesh.select_more()
-    bpy.ops.object.editmode_toggle()
-    intersection_vert_indices = [v.index for v in dst_mesh.vertices if v.select]
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.region_to_loop()
-    bpy.ops.object.editmode_toggle()
-    idx_to_bmvert = {v.index: bm.verts.new(dst_to_obj @ v.co)
-        for v in dst_mesh.vertices if v.select}
+        vert_selected = np.zeros(len(dst_mesh.vertices), dtype=bool)
+        vert_selected[loop_verts[face_selected[loop_faces]]] = True
+        face_selected = np.bincount(loop_faces, weights=vert_selected[loop_verts],
+            minlength=num_dst_faces) > 0
+    intersection_face_indices = np.flatnonzero(face_selected)
+    intersection_vert_indices = np.unique(loop_verts[face_selected[loop_faces]])
+
+    # Loop edges have some but not all of their faces selected, or are on the mesh boundary
+    num_edge_faces = np.bincount(loop_edges, minlength=len(dst_mesh.edges))
+    num_edge_faces_selected = np.bincount(loop_edges, weights=face_selected[loop_faces],
+        minlength=len(dst_mesh.edges))
+    edge_mask = (num_edge_faces_selected > 0) & ((num_edge_faces_selected != num_edge_faces)
+        | (num_edge_faces == 1))
+    edge_verts = np.empty(len(dst_mesh.edges) * 2, dtype=np.intc)
+    dst_mesh.edges.foreach_get('vertices', edge_verts)
+    edge_verts = edge_verts.reshape(-1, 2)[edge_mask]
+    boundary_vert_indices = np.unique(edge_verts)
+
+    dst_to_obj_np = np.array(dst_to_obj)
+    boundary_coords = (dst_data.coords[boundary_vert_indices]
+        @ dst_to_obj_np[:3, :3].T + dst_to_obj_np[:3, 3])
+    idx_to_bmvert = {idx: bm.verts.new(co)
+        for idx, co in zip(boundary_vert_indices.tolist(), boundary_coords.tolist())}
     bm.verts.index_update()
-    edges2 = [bm.edges.new((idx_to_bmvert[e.vertices[0]], idx_to_bmvert[e.vertices[1]]))
-        for e in dst_mesh.edges if e.select]
+    edges2 = [bm.edges.new((idx_to_bmvert[a], idx_to_bmvert[b])) for a, b in edge_verts.tolist()]
     bm.edges.index_update()
     # fm_layer = bm.faces.layers.face_map.verify()
 
@@ -112,7 +246,7 @@ def do_graft(context, save, obj, dst_obj, expand=0, cuts=0, blend_distance=0.0,
         if edge.is_boundary:
             for vert in edge.verts:
                 vert[deform_layer][blend_vg.index] = 1.0
-    if copy_normals and blend_distance > 0.0:
+    if (copy_normals or copy_shape_keys) and blend_distance > 0.0:
         bmesh_vertex_group_bleed(bm, blend_vg.index, distance=blend_distance, power=blend_power)
 
     # Apply the result
@@ -158,7 +292,12 @@ def do_graft(context, save, obj, dst_obj, expand=0, cuts=0, blend_distance=0.0,
                 data_mod.loop_mapping = 'POLYINTERP_NEAREST'
             with_object(bpy.ops.object.datalayout_transfer, obj, modifier=data_mod.name)
 
-    return intersection_vert_indices, intersection_face_indices
+    if copy_shape_keys:
+        # Only the bridge and the blended area around it follow the target's shape keys
+        transfer_shape_keys(obj, dst_obj, blend_vg.index, cache, key_obj=shape_key_obj)
+
+    return (intersection_vert_indices.tolist(), intersection_face_indices.tolist(),
+        boundary_vert_indices.tolist())
 
 class GRET_OT_graft(bpy.types.Operator):
     """Connect boundaries of selected objects to the active object"""
@@ -187,14 +326,14 @@ class GRET_OT_graft(bpy.types.Operator):
     )
     blend_distance: bpy.props.FloatProperty(
         name="Normal Blend Distance",
-        description="Blend in normals from the target mesh",
+        description="Blend in normals and shape keys from the target mesh",
         subtype='DISTANCE',
         default=0.0,
         min=0.0,
     )
     blend_power: bpy.props.FloatProperty(
         name="Normal Blend Power",
-        description="Adjust the strength of normal blending",
+        description="Adjust the strength of normal and shape key blending",
         default=1.0,
         min=0.01,
     )
@@ -223,6 +362,11 @@ class GRET_OT_graft(bpy.types.Operator):
         description="Transfer UV layers from the target mesh",
         default=True,
     )
+    copy_shape_keys: bpy.props.BoolProperty(
+        name="Copy Shape Keys",
+        description="Transfer shape keys from the target mesh",
+        default=False,
+    )
     copy_modifiers: bpy.props.BoolProperty(
         name="Copy Modifiers",
         description="Transfer modifiers from the target mesh",
@@ -252,8 +396,19 @@ class GRET_OT_graft(bpy.types.Operator):
             else:
                 dst_obj = orig_dst_obj
                 save.prop_foreach(dst_obj.modifiers, 'show_viewport', False)
-            dst_mesh = dst_obj.data
 
+            # The evaluated clone has no shape keys, read them from the original if vertices match
+            copy_shape_keys = self.copy_shape_keys
+            if copy_shape_keys and not orig_dst_obj.data.shape_keys:
+                self.report({'WARNING'}, f"{orig_dst_obj.name} has no shape keys to copy.")
+                copy_shape_keys = False
+            elif copy_shape_keys and len(orig_dst_obj.data.vertices) != len(dst_obj.data.vertices):
+                self.report({'WARNING'}, "Can't copy shape keys, viewport modifiers change "
+                    "the target's vertex count.")
+                copy_shape_keys = False
+
+            # Target data is the same for every loose part, only read it once
+            cache = {}
             for obj in objs:
                 # Separate by loose parts
                 select_only(context, obj)
@@ -264,7 +419,7 @@ class GRET_OT_graft(bpy.types.Operator):
 
                 for src_obj in src_objs:
                     try:
-                        intersection_vert_indices, _ = do_graft(context, save,
+                        intersection_vert_indices, _, boundary_vert_indices = do_graft(context, save,
                             obj=src_obj,
                             dst_obj=dst_obj,
                             expand=self.expand,
@@ -274,7 +429,10 @@ class GRET_OT_graft(bpy.types.Operator):
                             face_map_name=self.face_map_name,
                             copy_normals=self.copy_normals,
                             copy_vertex_groups=self.copy_vertex_groups,
-                            copy_uv_layers=self.copy_uv_layers)
+                            copy_uv_layers=self.copy_uv_layers,
+                            copy_shape_keys=copy_shape_keys,
+                            shape_key_obj=orig_dst_obj,
+                            cache=cache)
                     except GraftError as e:
                         self.report({'WARNING'}, f"Can't graft {obj.name}: {e}")
                         continue
@@ -286,8 +444,9 @@ class GRET_OT_graft(bpy.types.Operator):
                         vg_name = self.vertex_group_name
                     if vg_name:
                         vg = get_vgroup(orig_dst_obj, vg_name, clean=False)
-                        intersecting_verts = (dst_mesh.vertices[i] for i in intersection_vert_indices)
-                        vg.add([v.index for v in intersecting_verts if not v.select], 1.0, 'REPLACE')
+                        boundary_vert_indices = set(boundary_vert_indices)
+                        vg.add([i for i in intersection_vert_indices if i not in boundary_vert_indices],
+                            1.0, 'REPLACE')
 
                 # Rejoin loose parts
                 if len(src_objs) > 1:
@@ -323,12 +482,13 @@ class GRET_OT_graft(bpy.types.Operator):
         row.prop(self, 'copy_normals', text="Norms.", toggle=1)
         row.prop(self, 'copy_vertex_groups', text="Groups", toggle=1)
         row.prop(self, 'copy_uv_layers', text="UVs", toggle=1)
+        row.prop(self, 'copy_shape_keys', text="Keys", toggle=1)
         row.prop(self, 'copy_modifiers', text="Modif.", toggle=1)
 
         row = layout.row(align=True)
         row.prop(self, 'blend_distance', text="Blend Distance")
         row.prop(self, 'blend_power', text="Power")
-        row.enabled = self.copy_normals
+        row.enabled = self.copy_normals or self.copy_shape_keys
 
 def draw_panel(self, context):
     layout = self.layout
@@ -1,9 +1,10 @@
-from fnmatch import fnmatch
+from fnmatch import fnmatch, translate
 from math import cos
 from mathutils import Vector
 import bmesh
 import bpy
 import numpy as np
+import os
 import re
 
 from .. import prefs
@@ -18,10 +19,19 @@ from ..helpers import (
     with_object,
 )
 from ..log import logger, log, logd
-from ..math import lerp, one_vector, half_vector
+from ..math import find_close_pairs, lerp, one_vector, half_vector, union_find
 
 fmt_shape_key = lambda sk: (sk.name if sk.value == 1.0 else f"{sk.name} ({fmt_fraction(sk.value, 1.0)})")
 
+def compile_name_pattern(pattern):
+    """Compiles a wildcard pattern once. Matches like fnmatch, including case folding on Windows."""
+    return re.compile(translate(pattern), re.IGNORECASE if os.path.normcase("A") == "a" else 0)
+
+def get_shape_key_coords(shape_key, num_verts):
+    coords = np.empty(num_verts * 3, dtype=np.single)
+    shape_key.data.foreach_get('co', coords)
+    return coords
+
 def _select_mesh_elements(collection, select=True, indices=None, key=None):
     values = np.zeros(len(collection), dtype=bool)
     collection.foreach_set('hide', values)
@@ -218,6 +228,33 @@ def merge_vertex_groups(obj, src_name, dst_name, remove_src=True):
     if remove_src:
         obj.vertex_groups.remove(src)
 
+def get_vertex_group_weights(obj, vertex_group_index):
+    """Returns an array with the weight of each vertex in a vertex group, zero if unassigned."""
+
+    weights = np.zeros(len(obj.data.vertices), dtype=np.single)
+    for vert in obj.data.vertices:
+        for vgrp in vert.groups:
+            if vgrp.group == vertex_group_index:
+                weights[vert.index] = vgrp.weight
+                break
+    return weights
+
+def set_vertex_group_weights(vertex_group, weights, indices=None):
+    """
+    Assigns weights to a vertex group in bulk, one call for each distinct weight value.
+
+    weights: Array with a weight for each vertex, or for each index if indices is given.
+    indices: Optional array of vertex indices that the weights correspond to.
+    """
+
+    unique_weights, inverse = np.unique(weights, return_inverse=True)
+    if indices is None:
+        indices = np.arange(len(weights))
+    order = np.argsort(inverse, kind='stable')
+    splits = np.cumsum(np.bincount(inverse, minlength=len(unique_weights)))[:-1]
+    for weight, bucket in zip(unique_weights.tolist(), np.split(indices[order], splits)):
+        vertex_group.add(bucket.tolist(), weight, 'REPLACE')
+
 def subdivide_vertex_group(obj, src_name, dst_names, bone_head, bone_tail, remove_src=True):
     """Subdivides a vertex group along a line."""
 
@@ -246,24 +283,19 @@ def subdivide_vertex_group(obj, src_name, dst_names, bone_head, bone_tail, remov
 def duplicate_shape_key(obj, name, new_name):
     shape_key = obj.data.shape_keys.key_blocks[name]
 
-    # Store state
-    saved_show_only_shape_key = obj.show_only_shape_key
-    saved_active_shape_key_index = obj.active_shape_key_index
-    saved_value = shape_key.value
-
-    # Duplicate by muting all (with show_only_shape_key)
-    shape_key_index = obj.data.shape_keys.key_blocks.find(name)
-    obj.active_shape_key_index = shape_key_index
-    obj.active_shape_key.value = obj.active_shape_key.slider_max
-    obj.show_only_shape_key = True
-    new_shape_key = obj.shape_key_add(name=new_name, from_mix=True)
-    new_shape_key.slider_max = obj.active_shape_key.slider_max
-    new_shape_key.value = saved_value
-
-    # Restore state
-    obj.show_only_shape_key = saved_show_only_shape_key
-    obj.active_shape_key_index = saved_active_shape_key_index
-    shape_key.value = saved_value
+    # Copy coordinates directly instead of evaluating the mix
+    new_shape_key = obj.shape_key_add(name=new_name, from_mix=False)
+    coords = get_shape_key_coords(shape_key, len(shape_key.data))
+    new_shape_key.data.foreach_set('co', coords)
+    new_shape_key.relative_key = shape_key.relative_key
+    new_shape_key.interpolation = shape_key.interpolation
+    new_shape_key.vertex_group = shape_key.vertex_group
+    # Slider min/max setters clamp, so change them in the right order
+    if shape_key.slider_max > 0.0:
+        new_shape_key.slider_max, new_shape_key.slider_min = shape_key.slider_max, shape_key.slider_min
+    else:
+        new_shape_key.slider_min, new_shape_key.slider_max = shape_key.slider_min, shape_key.slider_max
+    new_shape_key.value = shape_key.value
 
     return new_shape_key
 
@@ -318,8 +350,9 @@ def merge_shape_keys(obj, shape_key_name="*", target_shape_key_name="", override
     saved_unmuted_shape_key_drivers = []
 
     # Mute all but the ones to be merged
+    name_pattern = compile_name_pattern(shape_key_name)
     for sk in mesh.shape_keys.key_blocks[1:]:
-        if sk.name != target_shape_key_name and fnmatch(sk.name, shape_key_name):
+        if sk.name != target_shape_key_name and name_pattern.match(sk.name):
             # Remove any drivers related to shape keys that will be deleted
             if mesh.shape_keys.animation_data:
                 sk_data_path = f'key_blocks["{sk.name}"]'
@@ -352,22 +385,44 @@ def merge_shape_keys(obj, shape_key_name="*", target_shape_key_name="", override
         log(f"Merging {len(source_shape_keys)} shape keys to {target_shape_key_name}: " +
             ", ".join(fmt_shape_key(sk) for sk in source_shape_keys))
 
-        # Add mix to target shape key. While the basis layer *does* exist in bmesh, changing it
-        # doesn't seem to have any effect, hence the split code path.
-        merged_sk = obj.shape_key_add(name="__merged", from_mix=True)
-        bm = bmesh.new()
-        bm.from_mesh(mesh)
-        merged_layer = bm.verts.layers.shape[merged_sk.name]
+        key_blocks = mesh.shape_keys.key_blocks
+        basis_sk = key_blocks[0]
+        num_verts = len(mesh.vertices)
+        if any(sk.vertex_group for sk in source_shape_keys):
+            # Vertex group influence can't be read in bulk, let Blender evaluate the mix
+            merged_sk = obj.shape_key_add(name="__merged", from_mix=True)
+            delta = get_shape_key_coords(merged_sk, num_verts) - get_shape_key_coords(basis_sk, num_verts)
+            obj.shape_key_remove(merged_sk)
+        else:
+            # Sum weighted deltas along the key axis
+            coords = np.empty((len(source_shape_keys), num_verts * 3), dtype=np.single)
+            relative_coords = {}
+            for sk, sk_coords in zip(source_shape_keys, coords):
+                sk.data.foreach_get('co', sk_coords)
+                relative_sk = sk.relative_key
+                if relative_sk.name not in relative_coords:
+                    relative_coords[relative_sk.name] = get_shape_key_coords(relative_sk, num_verts)
+                sk_coords -= relative_coords[relative_sk.name]
+            values = np.array([sk.value for sk in source_shape_keys], dtype=np.single)
+            delta = values @ coords
+
         if target_shape_key_name != basis_shape_key_name:
-            target_layer = bm.verts.layers.shape[target_shape_key_name]
-            for vert in bm.verts:
-                vert[target_layer] += vert[merged_layer] - vert.co
+            target_sk = key_blocks[target_shape_key_name]
+            target_coords = get_shape_key_coords(target_sk, num_verts)
+            target_coords += delta
+            target_sk.data.foreach_set('co', target_coords)
         else:
-            for vert in bm.verts:
-                vert.co = vert[merged_layer]
-        bm.to_mesh(mesh)
-        bm.free()
-        obj.shape_key_remove(merged_sk)
+            # Moving the basis drags along every shape key relative to it
+            source_shape_key_names = {sk.name for sk in source_shape_keys}
+            for sk in key_blocks:
+                if sk == basis_sk or (sk.name not in source_shape_key_names
+                    and sk.relative_key.name == basis_sk.name):
+                    sk_coords = get_shape_key_coords(sk, num_verts)
+                    sk_coords += delta
+                    sk.data.foreach_set('co', sk_coords)
+                    if sk == basis_sk:
+                        mesh.vertices.foreach_set('co', sk_coords)
+        mesh.update()
 
         # Remove the merged shapekeys
         for sk in source_shape_keys:
@@ -385,24 +440,89 @@ def merge_shape_keys(obj, shape_key_name="*", target_shape_key_name="", override
     if mesh.shape_keys and len(mesh.shape_keys.key_blocks) == 1:
         obj.shape_key_clear()
 
+def _is_used_elsewhere(id_data, owner):
+    """Returns whether any ID other than owner references the given ID, drivers included."""
+
+    users = bpy.data.user_map(subset={id_data}).get(id_data, set())
+    return any(user != owner and user != id_data for user in users)
+
+def _rebuild_shape_keys(obj, shape_keys):
+    """
+    Clears shape keys and adds back the ones given. Faster than removing many keys one by one.
+    Doesn't preserve animation data or drivers reading from the shape keys, check beforehand.
+    """
+
+    mesh = obj.data
+    num_verts = len(mesh.vertices)
+    key = mesh.shape_keys
+    key_name, use_relative, eval_time = key.name, key.use_relative, key.eval_time
+    # Copy custom properties out, the datablock they live in is about to be freed
+    key_props = {k: v.to_dict() if hasattr(v, 'to_dict') else v.to_list() if hasattr(v, 'to_list') else v
+        for k, v in key.items()}
+    kept_names = {sk.name for sk in shape_keys}
+    # Keys relative to a removed key fall back to the basis, same as shape_key_remove
+    saved_shape_keys = [(sk.name, get_shape_key_coords(sk, num_verts),
+        sk.relative_key.name if sk.relative_key.name in kept_names else None, sk.interpolation,
+        sk.vertex_group, sk.slider_min, sk.slider_max, sk.value, sk.mute, sk.lock_shape)
+        for sk in shape_keys]
+
+    obj.shape_key_clear()
+    for name, coords, *_ in saved_shape_keys:
+        sk = obj.shape_key_add(name=name, from_mix=False)
+        sk.data.foreach_set('co', coords)
+    key = mesh.shape_keys
+    key.name = key_name
+    key.use_relative = use_relative
+    key.eval_time = eval_time
+    for k, v in key_props.items():
+        key[k] = v
+    key_blocks = key.key_blocks
+    key_blocks[0].lock_shape = saved_shape_keys[0][-1]
+    for name, _, relative_name, interpolation, vertex_group, \
+        slider_min, slider_max, value, mute, lock_shape in saved_shape_keys[1:]:
+        sk = key_blocks[name]
+        sk.relative_key = key_blocks[relative_name or 0]
+        sk.interpolation = interpolation
+        sk.vertex_group = vertex_group
+        # Slider min/max setters clamp, so change them in the right order
+        if slider_max > 0.0:
+            sk.slider_max, sk.slider_min = slider_max, slider_min
+        else:
+            sk.slider_min, sk.slider_max = slider_min, slider_max
+        sk.value = value
+        sk.mute = mute
+        sk.lock_shape = lock_shape
+
 def remove_shape_keys(obj, shape_key_name="*"):
     mesh = obj.data
     if not mesh.shape_keys or len(mesh.shape_keys.key_blocks) <= 1:
         # No shape keys
         return
 
-    removed_shape_key_names = []
-    for sk in mesh.shape_keys.key_blocks[1:]:
-        if fnmatch(sk.name, shape_key_name):
-            removed_shape_key_names.append(sk.name)
-            obj.shape_key_remove(sk)
+    name_pattern = compile_name_pattern(shape_key_name)
+    key_blocks = mesh.shape_keys.key_blocks
+    removed_shape_keys = [sk for sk in key_blocks[1:] if name_pattern.match(sk.name)]
+    removed_shape_key_names = [sk.name for sk in removed_shape_keys]
 
-    if len(mesh.shape_keys.key_blocks) <= 1:
+    if not removed_shape_keys:
+        return
+    elif len(removed_shape_keys) == len(key_blocks) - 1:
         log(f"Removing all shape keys")
-    elif removed_shape_key_names:
+    else:
         log(f"Removing {len(removed_shape_key_names)} shape keys: " +
             ", ".join(removed_shape_key_names))
 
+    if (len(removed_shape_keys) * 2 > len(key_blocks)
+        and not mesh.shape_keys.animation_data
+        and not _is_used_elsewhere(mesh.shape_keys, mesh)):
+        # Each removal fixes up relative keys, rebuilding is cheaper when most keys go
+        # Rebuilding creates a new datablock, so not done if anything animates or reads from it
+        removed_shape_key_names = set(removed_shape_key_names)
+        _rebuild_shape_keys(obj, [sk for sk in key_blocks if sk.name not in removed_shape_key_names])
+    else:
+        for sk in removed_shape_keys:
+            obj.shape_key_remove(sk)
+
 def mirror_shape_keys(obj, side_vgroup_name):
     if not obj.data.shape_keys or not obj.data.shape_keys.key_blocks:
         # No shape keys
@@ -422,7 +542,8 @@ def mirror_shape_keys(obj, side_vgroup_name):
     vgroup.add(range(len(obj.data.vertices)), 1.0, 'REPLACE')
     vgroup = get_vgroup(obj, other_side_vgroup_name, clean=True)
 
-    for sk in obj.data.shape_keys.key_blocks:
+    # Snapshot the list, duplicated keys are appended while iterating
+    for sk in obj.data.shape_keys.key_blocks[:]:
         flipped_name = flip_name(sk.name)
         # Only mirror it if it doesn't already exist
         if flipped_name and flipped_name not in obj.data.shape_keys.key_blocks:
@@ -596,13 +717,16 @@ def apply_modifiers(obj, should_apply_modifier, keep_armature=False):
     else:
         obj.modifiers.clear()
 
+    # Single buffer for restoring layers, large enough for any of them
+    buffer = np.empty(max(len(obj.data.loops) * 4, len(obj.data.vertices)), dtype=np.single)
+
     # Restore UV layers from attributes
     for name in uv_layer_names:
         if name not in obj.data.uv_layers:
             attr = obj.data.attributes.get(name)
             if attr and attr.domain == 'CORNER' and attr.data_type == 'FLOAT2':
                 log(f"Restoring UV layer {name} from attribute")
-                uvs = [0.0] * (len(attr.data) * 2)
+                uvs = buffer[:len(attr.data) * 2]
                 attr.data.foreach_get('vector', uvs)
                 obj.data.attributes.remove(attr)  # Avoid collisions
 
@@ -619,19 +743,12 @@ def apply_modifiers(obj, should_apply_modifier, keep_armature=False):
             attr = obj.data.attributes.get(name)
             if attr and attr.domain == 'POINT' and attr.data_type == 'FLOAT':
                 log(f"Restoring vertex group {name} from attribute")
-                values = [0.0] * (len(attr.data) * 1)
+                values = buffer[:len(attr.data)]
                 attr.data.foreach_get('value', values)
                 obj.data.attributes.remove(attr)  # Avoid collisions
 
                 vertex_group = obj.vertex_groups.new(name=name)
-                vertex_group_index = vertex_group.index
-                bm = bmesh.new()
-                bm.from_mesh(obj.data)
-                deform_layer = bm.verts.layers.deform.verify()
-                for vert, value in zip(bm.verts, values):
-                    vert[deform_layer][vertex_group_index] = value
-                bm.to_mesh(obj.data)
-                bm.free()
+                set_vertex_group_weights(vertex_group, values)
             elif attr:
                 log(f"Can't restore vertex group {name}, attribute has wrong domain or data type")
             else:
@@ -643,7 +760,7 @@ def apply_modifiers(obj, should_apply_modifier, keep_armature=False):
             attr = obj.data.attributes.get(name)
             if attr and attr.domain == 'CORNER' and attr.data_type == 'FLOAT_COLOR':
                 log(f"Restoring vertex color layer {name} from attribute")
-                colors = [0.0] * (len(attr.data) * 4)
+                colors = buffer[:len(attr.data) * 4]
                 attr.data.foreach_get('color', colors)
                 obj.data.attributes.remove(attr)  # Avoid collisions
 
@@ -672,90 +789,119 @@ def apply_shape_keys_with_vertex_groups(obj):
                 except RuntimeError:
                     vert.co[:] = v0
 
+def weld_mesh(mesh, weld_map):
+    """Welds mesh vertices according to a weld map, an array of destination index per vertex."""
+
+    src_idxs = np.flatnonzero(weld_map != np.arange(len(weld_map)))
+    if not len(src_idxs):
+        return
+
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bm_verts = list(bm.verts)
+    targetmap = dict(zip(map(bm_verts.__getitem__, src_idxs.tolist()),
+        map(bm_verts.__getitem__, weld_map[src_idxs].tolist())))
+    bmesh.ops.weld_verts(bm, targetmap=targetmap)
+    bm.to_mesh(mesh)
+    bm.free()
+
 def merge_islands(obj, mode='ALWAYS', threshold=1e-3):
-    """Does 'Remove Doubles' on specified edges. Returns the number of vertices merged."""
-    # Reverted to using bpy.ops because bmesh is failing to merge normals correctly
-    # TODO This should consider that each vertex has its pair (and only one pair) in another island
+    """
+    Welds vertices on specified edges to close vertices in other islands.
+    Each vertex is welded to at most one vertex on each other island.
 
-    saved_mode = obj.mode
+    Returns the number of vertices merged.
+    """
+
+    assert obj.type == 'MESH' and obj.mode == 'OBJECT'
+    mesh = obj.data
+    num_verts = len(mesh.vertices)
 
+    edge_verts = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edge_verts)
+    edge_verts.shape = (-1, 2)
     if mode == 'ALWAYS':
-        edit_mesh_elements(obj, 'EDGE')
+        edge_mask = np.ones(len(mesh.edges), dtype=bool)
     elif mode == 'BOUNDARY':
-        edit_mesh_elements(obj, 'EDGE')
-        bpy.ops.mesh.region_to_loop()
+        loop_edges = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get('edge_index', loop_edges)
+        edge_mask = np.bincount(loop_edges, minlength=len(mesh.edges)) == 1
     elif mode == 'TAGGED':
-        edit_mesh_elements(obj, 'EDGE', key=lambda e: e.use_freestyle_mark)
+        edge_mask = np.empty(len(mesh.edges), dtype=bool)
+        mesh.edges.foreach_get('use_freestyle_mark', edge_mask)
     else:
         return 0
 
-    # Shape keys tend to break when removing doubles and vertices don't exactly match. Not sure
-    # about the root cause, just moving the vertices together is enough to fix it.
-    # Have to exit edit mode since bmesh.from_edit_mesh() won't update shape keys
-    if False:
-        bpy.ops.object.editmode_toggle()
-        bm = bmesh.new()
-        bm.from_mesh(obj.data)
-
-        verts = [v for v in bm.verts if v.select]
-        targetmap = bmesh.ops.find_doubles(bm, verts=verts, dist=threshold)['targetmap']
-        num_shape_keys = len(bm.verts.layers.shape)
-        for shape_key_index in range(num_shape_keys):
-            shape_layer = bm.verts.layers.shape[shape_key_index]
-            for src_vert, dst_vert in targetmap.items():
-                src_vert[shape_layer] = dst_vert[shape_layer]
-
-        bm.to_mesh(obj.data)
-        bm.free()
-        obj.data.update()
-        bpy.ops.object.editmode_toggle()
-
-    old_num_verts = len(obj.data.vertices)
-    bpy.ops.mesh.remove_doubles(threshold=threshold, use_unselected=False)
-
-    # mesh = obj.data
-    # bm = bmesh.new()
-    # bm.from_mesh(mesh)
-    # bm.edges.ensure_lookup_table()
-    # old_num_verts = len(bm.verts)
-
-    # # Seems the following would be the proper way, however as of 2.90.0 it returns NotImplemented
-    # # fs_layer = bm.edges.layers.freestyle.active
-    # # fs_edges = [e for e in bm.edges if e[fs_layer]]
-    # fs_edges = [e for e in bm.edges if mesh.edges[e.index].use_freestyle_mark]
-
-    # # Get list of unique verts
-    # fs_verts = list(set(chain.from_iterable(e.verts for e in fs_edges)))
-    # bmesh.ops.remove_doubles(bm, verts=fs_verts, dist=1e-5)
-    # new_num_verts = len(bm.verts)
-
-    # # Finish and clean up
-    # bm.to_mesh(mesh)
-    # bm.free()
-
-    # Clean up
-    bpy.ops.object.mode_set(mode=saved_mode)
-    obj.data.update()
-    new_num_verts = len(obj.data.vertices)
+    islands = union_find(num_verts, edge_verts[:, 0], edge_verts[:, 1])
+    vert_idxs = np.unique(edge_verts[edge_mask])
+    coords = np.empty(num_verts * 3, dtype=np.single)
+    mesh.vertices.foreach_get('co', coords)
+    coords.shape = (-1, 3)
+
+    # Find close vertex pairs across islands
+    a, b = find_close_pairs(coords[vert_idxs], threshold)
+    a, b = vert_idxs[a], vert_idxs[b]
+    mask = islands[a] != islands[b]
+    a, b = a[mask], b[mask]
+    deltas = coords[a] - coords[b]
+    dist_sq = np.einsum('ij,ij->i', deltas, deltas)
+
+    # Pair each vertex with the closest vertex of every other island, then keep mutual pairs only
+    # Otherwise nearby vertices of the same island could end up collapsed into each other
+    group_keys = a.astype(np.int64) * num_verts + islands[b]
+    order = np.lexsort((dist_sq, group_keys))
+    _, first_idxs = np.unique(group_keys[order], return_index=True)
+    a, b = a[order[first_idxs]], b[order[first_idxs]]
+    mask = np.isin(b.astype(np.int64) * num_verts + a, a.astype(np.int64) * num_verts + b)
+    weld_map = union_find(num_verts, a[mask], b[mask])
+    src_idxs = np.flatnonzero(weld_map != np.arange(num_verts))
+    if not len(src_idxs):
+        return 0
 
-    return old_num_verts - new_num_verts
+    # Shape keys tend to break when welding vertices that don't exactly match. Not sure about the
+    # root cause, just moving the vertices together in every layer is enough to fix it.
+    layers = [mesh.vertices]
+    if mesh.shape_keys:
+        layers.extend(shape_key.data for shape_key in mesh.shape_keys.key_blocks)
+    for layer in layers:
+        layer.foreach_get('co', coords.ravel())
+        coords[src_idxs] = coords[weld_map[src_idxs]]
+        layer.foreach_set('co', coords.ravel())
+    mesh.update()
+
+    # Reverted to using bpy.ops because bmesh is failing to merge normals correctly
+    # Pairs overlap exactly now, so a tiny threshold only merges the pairs found above
+    edit_mesh_elements(obj, 'VERT', indices=np.union1d(src_idxs, weld_map[src_idxs]))
+    bpy.ops.mesh.remove_doubles(threshold=1e-6, use_unselected=False)
+    bpy.ops.object.editmode_toggle()
+
+    return num_verts - len(mesh.vertices)
 
 def delete_faces_with_no_material(obj):
     if not any(not mat for mat in obj.data.materials):
         # All material slots are filled, nothing to do
         return
 
+    mesh = obj.data
+    empty_slots = np.array([not mat for mat in mesh.materials], dtype=bool)
+    material_indices = np.empty(len(mesh.polygons), dtype=np.intc)
+    mesh.polygons.foreach_get('material_index', material_indices)
+    np.clip(material_indices, 0, len(empty_slots) - 1, out=material_indices)
+    delete_indices = np.flatnonzero(empty_slots[material_indices])
+    if not delete_indices.size:
+        # Empty slots aren't in use
+        return
+
     bm = bmesh.new()
-    bm.from_mesh(obj.data)
+    bm.from_mesh(mesh)
 
     bm.faces.ensure_lookup_table()
-    delete_geom = [f for f in bm.faces if not obj.data.materials[f.material_index]]
+    delete_geom = [bm.faces[face_idx] for face_idx in delete_indices.tolist()]
     bmesh.ops.delete(bm, geom=delete_geom, context='FACES')
-    if delete_geom:
-        log(f"Deleted {len(delete_geom)} faces with no material")
+    log(f"Deleted {len(delete_geom)} faces with no material")
 
     # Finish and clean up
-    bm.to_mesh(obj.data)
+    bm.to_mesh(mesh)
     bm.free()
 
 def unsubdivide_preserve_uvs(obj, levels):
@@ -763,17 +909,24 @@ def unsubdivide_preserve_uvs(obj, levels):
     # Works only as intended on intact subdivided meshes, not very reliable
 
     assert levels > 0
+    mesh = obj.data
+    edge_seams = np.empty(len(mesh.edges), dtype=bool)
+    mesh.edges.foreach_get('use_seam', edge_seams)
+
     bm = bmesh.new()
-    bm.from_mesh(obj.data)
+    bm.from_mesh(mesh)
 
-    seams = [e for e in bm.edges if e.seam]
-    bmesh.ops.split_edges(bm, edges=seams, use_verts=False)
+    bm.edges.ensure_lookup_table()
+    seams = [bm.edges[edge_idx] for edge_idx in np.flatnonzero(edge_seams).tolist()]
+    if seams:
+        bmesh.ops.split_edges(bm, edges=seams, use_verts=False)
     bmesh.ops.unsubdivide(bm, verts=bm.verts, iterations=levels*2)
-    seam_verts = [v for v in bm.verts if any(e.seam for e in v.link_edges)]
-    bmesh.ops.remove_doubles(bm, verts=seam_verts, dist=1e-5)
+    if seams:
+        seam_verts = list({v for e in bm.edges if e.seam for v in e.verts})
+        bmesh.ops.remove_doubles(bm, verts=seam_verts, dist=1e-5)
 
     # Finish and clean up
-    bm.to_mesh(obj.data)
+    bm.to_mesh(mesh)
     bm.free()
 
 def bmesh_vertex_group_bleed_internal(bm, get_weight, set_weight, distance, only_tagged=False):
@@ -1,13 +1,15 @@
-from collections import namedtuple, defaultdict
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import bmesh
 import bpy
+import os
 
 from ..helpers import with_object, get_modifier_mask
 from ..log import log, logd
-from ..math import get_dist_sq
+from ..math import union_find
 from ..operator import SaveContext
-from .helpers import edit_mesh_elements
+from .helpers import edit_mesh_elements, weld_mesh
 
 # shape_key_apply_modifiers TODO:
 # - Specialcase more merging modifiers, solidify for example
@@ -47,29 +49,61 @@ class ShapeKeyInfo(namedtuple('ShapeKeyInfo', 'coords interpolation mute name sl
     def put_coords_into(self, vertices):
         vertices.foreach_set('co', self.coords)
 
-def weld_mesh(mesh, weld_map):
-    """Welds mesh vertices according to a source index to destination index weld map."""
-
-    bm = bmesh.new()
-    bm.from_mesh(mesh)
-    bm.verts.ensure_lookup_table()
-    targetmap = {bm.verts[src_idx]: bm.verts[dst_idx] for src_idx, dst_idx in weld_map.items()}
-    bmesh.ops.weld_verts(bm, targetmap=targetmap)
-    bm.to_mesh(mesh)
-    bm.free()
-
 def apply_modifier(modifier):
     try:
         with_object(bpy.ops.object.modifier_apply, modifier.id_data, modifier=modifier.name)
     except RuntimeError:
         logd(f"Couldn't apply {modifier.type} modifier {modifier.name}")
 
+def get_weld_linear_map(weld_map):
+    """Returns the linear map of a weld, which simply drops the source vertices."""
+
+    return np.flatnonzero(weld_map == np.arange(len(weld_map))), None
+
+def get_linear_map(modifier_handlers, num_verts):
+    """
+    Composes the linear maps of the given modifier handlers, once they've been applied.
+
+    Returns a pair (indices, matrices) describing each output vertex as a transform of an input
+    vertex. This is a sparse input-to-output matrix with a single 3x3 block in each row, stored as
+    a source index and the block itself. matrices is None if all blocks are identity.
+    Returns None if any of the modifiers can't be expressed as a linear map.
+    """
+
+    indices, matrices = np.arange(num_verts), None
+    for modifier_handler in modifier_handlers:
+        linear_map = modifier_handler.get_linear_map(len(indices))
+        if linear_map is None:
+            return None
+        stage_indices, stage_matrices = linear_map
+        indices = indices[stage_indices]
+        if matrices is not None:
+            matrices = matrices[stage_indices]
+            if stage_matrices is not None:
+                matrices = stage_matrices @ matrices
+        else:
+            matrices = stage_matrices
+    return indices, matrices
+
+def apply_linear_map(coords, linear_map, basis_coords, new_basis_coords):
+    """
+    Maps flat shape key coordinates through a linear map, returning new flat coordinates.
+    Only touches NumPy arrays so it's safe to call from worker threads.
+    """
+
+    indices, matrices = linear_map
+    deltas = (coords - basis_coords).reshape(-1, 3)[indices]
+    if matrices is not None:
+        deltas = np.matmul(matrices, deltas[:, :, np.newaxis])
+    return deltas.ravel() + new_basis_coords
+
 class ModifierHandler:
     """Subclass this to define special behavior when applying different modifiers."""
 
     modifier_type = None
     modifier_name = None
     apply_post = False  # Apply after shape keys have been merged back?
+    linear = False  # Output vertices are a fixed linear transform of input vertices?
 
     def __init__(self, modifier):
         self.modifier_name = modifier.name
@@ -81,72 +115,103 @@ class ModifierHandler:
     def apply(self, obj):
         apply_modifier(obj.modifiers[self.modifier_name])
 
+    def get_linear_map(self, num_verts):
+        """Returns (indices, matrices) for the output vertices, see get_linear_map().
+Only valid after the handler has been applied once. Returns None if not linear."""
+        return None
+
 class MirrorModifierHandler(ModifierHandler):
     modifier_type = 'MIRROR'
-    weld_map = None  # Specifies vertex pairs to be welded
+    weld_map = None  # Destination index for each vertex, specifies which vertices to weld
 
     def __init__(self, modifier):
         super().__init__(modifier)
+        self.use_merge = modifier.use_mirror_merge
         self.merge_dist = modifier.merge_threshold
         self.num_mirrors = sum(modifier.use_axis)
+        self.linear = not any(modifier.use_bisect_axis)
+
+        # Mirror matrices in object space, see MOD_mirror.cc
+        obj = modifier.id_data
+        mirror_obj = modifier.mirror_object
+        basis = (obj.matrix_world.inverted() @ mirror_obj.matrix_world).to_3x3() if mirror_obj else None
+        self.mirror_matrices = []
+        for axis, use_axis in enumerate(modifier.use_axis):
+            if use_axis:
+                mtx = np.identity(3, dtype=np.single)
+                mtx[axis, axis] = -1.0
+                if basis is not None:
+                    mtx = np.array(basis, dtype=np.single) @ mtx @ np.array(basis.inverted_safe(),
+                        dtype=np.single)
+                self.mirror_matrices.append(mtx)
 
     @classmethod
     def poll(cls, modifier):
-        return super().poll(modifier) and modifier.use_mirror_merge and any(modifier.use_axis)
+        return super().poll(modifier) and any(modifier.use_axis)
 
     def apply(self, obj):
         modifier = obj.modifiers[self.modifier_name]
+        if not self.use_merge:
+            apply_modifier(modifier)
+            return
 
         modifier.use_mirror_merge = False
         with_object(bpy.ops.object.modifier_apply, obj, modifier=modifier.name)
 
-        if not self.weld_map:
+        if self.weld_map is None:
             self.fill_weld_map(obj)
         weld_mesh(obj.data, self.weld_map)
 
+    def get_linear_map(self, num_verts):
+        if not self.linear or (self.use_merge and self.weld_map is None):
+            return None
+
+        # Each mirrored axis appends a reflected copy of all the vertices so far
+        indices, matrices = np.arange(num_verts), np.broadcast_to(np.identity(3, dtype=np.single),
+            (num_verts, 3, 3))
+        for mtx in self.mirror_matrices:
+            indices = np.concatenate((indices, indices))
+            matrices = np.concatenate((matrices, mtx @ matrices))
+
+        if self.use_merge:
+            weld_indices, _ = get_weld_linear_map(self.weld_map)
+            indices, matrices = indices[weld_indices], matrices[weld_indices]
+        return indices, matrices
+
     def fill_weld_map(self, obj):
         mesh = obj.data
         num_verts = len(mesh.vertices) // (2 ** self.num_mirrors)  # Num of verts before mirroring
         merge_dist_sq = self.merge_dist ** 2
+        coords = np.empty(len(mesh.vertices) * 3, dtype=np.single)
+        mesh.vertices.foreach_get('co', coords)
+        coords.shape = (-1, 3)
 
         # Only consider pairs of mirrored vertices for merging. Probably breaks if flip is enabled
-        welds = []
+        src_idxs = dst_idxs = np.empty(0, dtype=int)
         for n in range(self.num_mirrors):
             num_part_verts = num_verts * (2 ** n)
 
-            new_welds = []
-            for src_idx, dst_idx in welds:
-                new_welds.append((src_idx + num_part_verts, dst_idx + num_part_verts))
-            welds.extend(new_welds)
-
-            for vert_idx in range(num_part_verts):
-                vert = mesh.vertices[vert_idx]
-                other_vert_idx = vert_idx + num_part_verts
-                other_vert = mesh.vertices[other_vert_idx]
-                if get_dist_sq(vert.co, other_vert.co) <= merge_dist_sq:
-                    welds.append((other_vert_idx, vert_idx))
-
-        # Resolve the welds into a single dict. Not too robust but weld_verts doesn't complain
-        self.weld_map = weld_map = {}
-        weld_map_reverse = defaultdict(list)
-        for src_idx, dst_idx in welds:
-            dst_idx = weld_map.get(dst_idx, dst_idx)
-            weld_map[src_idx] = dst_idx
-            old_idxs = weld_map_reverse.get(src_idx, [])
-            for old_idx in old_idxs:
-                weld_map[old_idx] = dst_idx
-                weld_map_reverse[dst_idx].append(old_idx)
-            weld_map_reverse[dst_idx].append(src_idx)
+            src_idxs = np.concatenate((src_idxs, src_idxs + num_part_verts))
+            dst_idxs = np.concatenate((dst_idxs, dst_idxs + num_part_verts))
+
+            deltas = coords[num_part_verts:num_part_verts*2] - coords[:num_part_verts]
+            vert_idxs = np.flatnonzero(np.einsum('ij,ij->i', deltas, deltas) <= merge_dist_sq)
+            src_idxs = np.concatenate((src_idxs, vert_idxs + num_part_verts))
+            dst_idxs = np.concatenate((dst_idxs, vert_idxs))
+
+        # Resolve weld chains so that every vertex points to the lowest index in its group
+        self.weld_map = union_find(len(coords), src_idxs, dst_idxs)
 
 class WeldModifierHandler(ModifierHandler):
     modifier_type = 'WELD'
-    weld_map = None  # Specifies vertex pairs to be welded
+    weld_map = None  # Destination index for each vertex, specifies which vertices to weld
 
     def __init__(self, modifier):
         super().__init__(modifier)
         self.merge_dist = modifier.merge_threshold
         self.vertex_group = modifier.vertex_group
         self.invert_vertex_group = modifier.invert_vertex_group
+        self.linear = True
 
     @classmethod
     def poll(cls, modifier):
@@ -157,10 +222,15 @@ class WeldModifierHandler(ModifierHandler):
 
         with_object(bpy.ops.object.modifier_remove, obj, modifier=modifier.name)
 
-        if not self.weld_map:
+        if self.weld_map is None:
             self.fill_weld_map(obj)
         weld_mesh(obj.data, self.weld_map)
 
+    def get_linear_map(self, num_verts):
+        if self.weld_map is None:
+            return None
+        return get_weld_linear_map(self.weld_map)
+
     def fill_weld_map(self, obj):
         mesh = obj.data
         vg = obj.vertex_groups.get(self.vertex_group)
@@ -176,9 +246,32 @@ class WeldModifierHandler(ModifierHandler):
         else:
             verts = bm.verts
         targetmap = bmesh.ops.find_doubles(bm, verts=verts, dist=self.merge_dist)['targetmap']
-        self.weld_map = {src.index: dst.index for src, dst in targetmap.items()}
+        self.weld_map = np.arange(len(bm.verts))
+        if targetmap:
+            src_idxs, dst_idxs = zip(*((src.index, dst.index) for src, dst in targetmap.items()))
+            self.weld_map[list(src_idxs)] = dst_idxs
         bm.free()
 
+class ArrayModifierHandler(ModifierHandler):
+    modifier_type = 'ARRAY'
+
+    def __init__(self, modifier):
+        super().__init__(modifier)
+        self.count = modifier.count
+        # Relative offset depends on the bounds of each shape key so it can't be linear
+        self.linear = (modifier.fit_type == 'FIXED_COUNT'
+            and not modifier.use_relative_offset
+            and not modifier.use_object_offset
+            and not modifier.use_merge_vertices
+            and not modifier.start_cap
+            and not modifier.end_cap)
+
+    def get_linear_map(self, num_verts):
+        if not self.linear:
+            return None
+        # Copies are appended in order and only differ by a constant offset
+        return np.tile(np.arange(num_verts), self.count), None
+
 class CollapseDecimateModifierHandler(ModifierHandler):
     modifier_type = 'DECIMATE'
     apply_post = True
@@ -214,6 +307,7 @@ class CollapseDecimateModifierHandler(ModifierHandler):
 modifier_handler_classes = (
     MirrorModifierHandler,
     WeldModifierHandler,
+    ArrayModifierHandler,
     CollapseDecimateModifierHandler,
     ModifierHandler,
 )
@@ -353,23 +447,19 @@ class GRET_OT_shape_key_apply_modifiers(bpy.types.Operator):
         print(f"Applying modifiers with {num_shape_keys} shape keys")
         mesh_copy = obj.data.copy()  # Copy for convenience, to be able to call from_existing(fcurve)
         shape_keys = obj.data.shape_keys.key_blocks if obj.data.shape_keys else []
-        shape_key_infos = []
+        shape_key_infos = [ShapeKeyInfo.from_shape_key(shape_key) for shape_key in shape_keys]
         saved_active_shape_key_index = obj.active_shape_key_index
         saved_show_only_shape_key = obj.show_only_shape_key
 
-        # Start by separating each shape key so modifiers can be applied one by one
-        shape_key_objs = []
-        for shape_key in shape_keys:
-            shape_key_info = ShapeKeyInfo.from_shape_key(shape_key)
-            shape_key_infos.append(shape_key_info)
-
-            new_obj = obj.copy()
-            new_obj.name = f"{obj.name}_{shape_key.name}"
-            new_obj.data = obj.data.copy()
-            shape_key_objs.append(new_obj)
+        # Shape keys are separated into new objects so modifiers can be applied one by one
+        # The template keeps the original modifiers since they're about to be applied to obj
+        template_obj = obj.copy()
+        template_obj.data = mesh_copy
 
         # Handle modifiers accordingly. This means recording welded vertex pairs for mirrors and such
         obj.shape_key_clear()
+        basis_coords = np.empty(len(obj.data.vertices) * 3, dtype=np.single)
+        obj.data.vertices.foreach_get('co', basis_coords)
         modifier_handlers = []
         post_modifier_handlers = []
         for modifier, mask in zip(obj.modifiers[:], self.modifier_mask):
@@ -386,33 +476,64 @@ class GRET_OT_shape_key_apply_modifiers(bpy.types.Operator):
                         modifier_handlers.append(modifier_handler)
                         break
 
-        # Store vertex coordinates of each shape key with modifiers applied
-        for sk_info, sk_obj in zip(shape_key_infos, shape_key_objs):
-            sk_mesh = sk_obj.data
-            sk_obj.shape_key_clear()
-            sk_info.put_coords_into(sk_mesh.vertices)
-            for modifier_handler in modifier_handlers:
-                modifier_handler.apply(sk_obj)
-            sk_info.get_coords_from(sk_mesh.vertices)
-
-            bpy.data.objects.remove(sk_obj)
-            bpy.data.meshes.remove(sk_mesh)
-
-        # Add the shape keys back
-        for shape_key_info in shape_key_infos:
-            shape_key = obj.shape_key_add()
-            shape_key.interpolation = shape_key_info.interpolation
-            shape_key.mute = shape_key_info.mute
-            shape_key.name = shape_key_info.name
-            shape_key.slider_max = shape_key_info.slider_max
-            shape_key.slider_min = shape_key_info.slider_min
-            shape_key.value = shape_key_info.value
-            shape_key.vertex_group = shape_key_info.vertex_group
-            if len(shape_key.data) * 3 != len(shape_key_info.coords):
-                self.report({'ERROR'}, f"Vertex count for {shape_key.name} did not match, "
-                    "the shape key will be lost.")
-                continue
-            shape_key_info.put_coords_into(shape_key.data)
+        # If the stack is linear the shape key deltas can be mapped directly, skipping evaluation
+        linear_map = None
+        if all(modifier_handler.linear for modifier_handler in modifier_handlers):
+            linear_map = get_linear_map(modifier_handlers, len(basis_coords) // 3)
+            if linear_map and len(linear_map[0]) != len(obj.data.vertices):
+                logd(f"Linear map has {len(linear_map[0])} vertices, "
+                    f"expected {len(obj.data.vertices)}")
+                linear_map = None
+
+        executor = mapped_coords = None
+        try:
+            if linear_map:
+                # NumPy releases the GIL, let workers map the keys while shape keys are added back
+                logd("Mapping shape keys through linear map")
+                new_basis_coords = np.empty(len(obj.data.vertices) * 3, dtype=np.single)
+                obj.data.vertices.foreach_get('co', new_basis_coords)
+                executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+                mapped_coords = [executor.submit(apply_linear_map, sk_info.coords, linear_map,
+                    basis_coords, new_basis_coords) for sk_info in shape_key_infos]
+            else:
+                # Store vertex coordinates of each shape key with modifiers applied
+                for sk_info in shape_key_infos:
+                    sk_obj = template_obj.copy()
+                    sk_obj.name = f"{obj.name}_{sk_info.name}"
+                    sk_obj.data = mesh_copy.copy()
+                    sk_mesh = sk_obj.data
+                    sk_obj.shape_key_clear()
+                    sk_info.put_coords_into(sk_mesh.vertices)
+                    for modifier_handler in modifier_handlers:
+                        modifier_handler.apply(sk_obj)
+                    sk_info.get_coords_from(sk_mesh.vertices)
+
+                    bpy.data.objects.remove(sk_obj)
+                    bpy.data.meshes.remove(sk_mesh)
+            bpy.data.objects.remove(template_obj)
+
+            # Add the shape keys back
+            for shape_key_index, shape_key_info in enumerate(shape_key_infos):
+                if mapped_coords:
+                    shape_key_info = shape_key_info._replace(
+                        coords=mapped_coords[shape_key_index].result())
+                shape_key = obj.shape_key_add()
+                shape_key.interpolation = shape_key_info.interpolation
+                shape_key.mute = shape_key_info.mute
+                shape_key.name = shape_key_info.name
+                shape_key.slider_max = shape_key_info.slider_max
+                shape_key.slider_min = shape_key_info.slider_min
+                shape_key.value = shape_key_info.value
+                shape_key.vertex_group = shape_key_info.vertex_group
+                if len(shape_key.data) * 3 != len(shape_key_info.coords):
+                    self.report({'ERROR'}, f"Vertex count for {shape_key.name} did not match, "
+                        "the shape key will be lost.")
+                    continue
+                shape_key_info.put_coords_into(shape_key.data)
+        finally:
+            # Don't leak worker threads if anything above raises
+            if executor:
+                executor.shutdown(cancel_futures=True)
 
         # For modifiers that should be applied after all the shapekeys are sorted
         for modifier_handler in post_modifier_handlers:
@@ -1,7 +1,8 @@
 import bpy
-import bmesh
+import numpy as np
 
 from ..math import invlerp
+from .helpers import get_vertex_group_weights
 
 class GRET_OT_shape_key_normalize(bpy.types.Operator):
     """Resets Min and Max of shape keys while keeping the range of motion.
@@ -17,6 +18,11 @@ Basis will change if Min is negative"""
         description="Apply vertex weight group",
         default=False,
     )
+    all_shape_keys: bpy.props.BoolProperty(
+        name="All Shape Keys",
+        description="Normalize every shape key instead of only the active one",
+        default=False,
+    )
 
     @classmethod
     def poll(cls, context):
@@ -25,49 +31,76 @@ Basis will change if Min is negative"""
 
     def execute(self, context):
         obj = context.active_object
-        sk = obj.active_shape_key
-        sk_value, sk_max, sk_min = sk.value, sk.slider_max, sk.slider_min
-
-        # Slider min/max setters clamp, so change them in the right order
-        if sk.slider_max > 0.0:
-            sk.slider_min, sk.slider_max = 0.0, 1.0
-        else:
-            sk.slider_max, sk.slider_min = 1.0, 0.0
-        sk.value = invlerp(sk_min, sk_max, sk_value)
-
-        bm = bmesh.new()
-        bm.from_mesh(obj.data)
-        bm.verts.layers.shape.verify()
-        if sk.relative_key == obj.data.shape_keys.key_blocks[0]:
-            base_shape_layer = None
+        mesh = obj.data
+        key_blocks = mesh.shape_keys.key_blocks
+        if self.all_shape_keys:
+            shape_keys = [sk for sk in key_blocks[1:] if sk.slider_min != 0.0 or sk.slider_max != 1.0]
         else:
-            base_shape_layer = bm.verts.layers.shape[sk.relative_key.name]
-        sk_layer = bm.verts.layers.shape[sk.name]
-        if self.apply_vertex_group and sk.vertex_group:
-            deform_layer = bm.verts.layers.deform.verify()
-            vertex_group_index = obj.vertex_groups[sk.vertex_group].index
-            sk.vertex_group = ''
-        else:
-            vertex_group_index = -1
-
-        for vert in bm.verts:
-            w = vert[deform_layer].get(vertex_group_index, 0.0) if vertex_group_index >= 0 else 1.0
-            if base_shape_layer is None:
-                co = vert.co.copy()
-                if sk_min < 0.0:
-                    vert.co = vert.co.lerp(vert[sk_layer], sk_min * w)
-                vert[sk_layer] = co.lerp(vert[sk_layer], (sk_max - sk_min) * w)
+            shape_keys = [obj.active_shape_key]
+
+        # Operate on every key at once as a (keys, verts, 3) array. New coordinates are only computed
+        # from the original snapshot, offsets to relative keys are accumulated and added at the end
+        coords = np.empty((len(key_blocks), len(mesh.vertices), 3), dtype=np.single)
+        for sk, sk_coords in zip(key_blocks, coords):
+            sk.data.foreach_get('co', sk_coords.ravel())
+        new_coords = coords.copy()
+        offsets = np.zeros_like(coords)
+        modified_indices = set()
+        updated_shape_key_names = set()
+
+        # Read each vertex group once
+        vertex_group_weights = {}
+        if self.apply_vertex_group:
+            for vertex_group_name in {sk.vertex_group for sk in shape_keys if sk.vertex_group}:
+                vertex_group_index = obj.vertex_groups[vertex_group_name].index
+                weights = get_vertex_group_weights(obj, vertex_group_index)
+                vertex_group_weights[vertex_group_name] = weights[:, np.newaxis]
+
+        for sk in shape_keys:
+            sk_value, sk_max, sk_min = sk.value, sk.slider_max, sk.slider_min
+
+            # Slider min/max setters clamp, so change them in the right order
+            if sk.slider_max > 0.0:
+                sk.slider_min, sk.slider_max = 0.0, 1.0
             else:
-                vert[sk_layer] = vert[base_shape_layer].lerp(vert[sk_layer], sk_max * w)
-                if sk_min < 0.0:
-                    vert[base_shape_layer] = vert[base_shape_layer].lerp(vert[sk_layer], sk_min * w)
-
-        bm.to_mesh(obj.data)
-        bm.free()
-        obj.data.update()
-
-        if sk_min < 0.0:
-            self.report({'INFO'}, f"{sk.relative_key.name} was updated to accomodate negative minimum.")
+                sk.slider_max, sk.slider_min = 1.0, 0.0
+            sk.value = invlerp(sk_min, sk_max, sk_value)
+
+            sk_index = key_blocks.find(sk.name)
+            relative_index = key_blocks.find(sk.relative_key.name)
+            delta = coords[sk_index] - coords[relative_index]
+            if sk.vertex_group in vertex_group_weights:
+                delta *= vertex_group_weights[sk.vertex_group]
+                sk.vertex_group = ''
+
+            if relative_index == 0:
+                new_coords[sk_index] = coords[0] + delta * (sk_max - sk_min)
+            else:
+                new_coords[sk_index] = coords[relative_index] + delta * sk_max
+            modified_indices.add(sk_index)
+            if sk_min < 0.0:
+                offsets[relative_index] += delta * sk_min
+                modified_indices.add(relative_index)
+                updated_shape_key_names.add(sk.relative_key.name)
+
+        # Offset to the basis carries over to all keys relative to it
+        basis_sk = key_blocks[0]
+        if offsets[0].any():
+            for sk_index, sk in enumerate(key_blocks):
+                if sk_index != 0 and sk.relative_key == basis_sk:
+                    offsets[sk_index] += offsets[0]
+                    modified_indices.add(sk_index)
+        for sk_index in modified_indices:
+            new_coords[sk_index] += offsets[sk_index]
+        if 0 in modified_indices:
+            mesh.vertices.foreach_set('co', new_coords[0].ravel())
+
+        for sk_index in sorted(modified_indices):
+            key_blocks[sk_index].data.foreach_set('co', new_coords[sk_index].ravel())
+        mesh.update()
+
+        for sk_name in sorted(updated_shape_key_names):
+            self.report({'INFO'}, f"{sk_name} was updated to accomodate negative minimum.")
 
         return {'FINISHED'}
 
@@ -1,15 +1,15 @@
-from math import ceil, modf, pi, acos
-from mathutils import Vector
+from math import ceil, modf, pi
 from mathutils.bvhtree import BVHTree
 from mathutils.kdtree import KDTree
 import bmesh
 import bpy
+import hashlib
 import numpy as np
 import sys
 
-from ..math import SMALL_NUMBER, saturate, lerp, get_dist
+from ..math import SMALL_NUMBER, lerp, find_nearest_points
 from ..helpers import show_only
-from .helpers import get_vcolor
+from .helpers import get_vcolor, get_vertex_group_weights
 from ..operator import SaveContext, SaveState
 
 src_items = [
@@ -33,6 +33,9 @@ component_items = [
     ('Z', "Z", "Z component of the vector"),
 ]
 
+channel_property_suffixes = ('invert', 'vertex_group', 'invert_vertex_group', 'component',
+    'extents', 'value', 'object', 'along_curve', 'blur', 'scale')
+
 def get_first_mapping(obj):
     if hasattr(obj, 'vertex_color_mapping') and obj.vertex_color_mapping:
         return obj.vertex_color_mapping[0]
@@ -49,83 +52,126 @@ def copy_mapping(obj, other_obj):
     if mapping and other_mapping:
         other_mapping.invert = mapping.invert
         for prefix in ('r', 'g', 'b', 'a'):
-            for suffix in ('', 'invert', 'vertex_group', 'invert_vertex_group', 'component',
-                'extents', 'value', 'object', 'along_curve', 'blur', 'scale'):
+            for suffix in ('',) + channel_property_suffixes:
                 property_name = f'{prefix}_{suffix}' if suffix else prefix
                 setattr(other_mapping, property_name, getattr(mapping, property_name))
 
 def values_to_vcol(mesh, src_values, dst_vcol, channel_idx, invert=False):
     assert len(src_values) in (len(mesh.loops), len(mesh.vertices)), "Wrong number of elements"
-    is_loops = len(src_values) == len(mesh.loops)
+    values = np.clip(np.asarray(src_values, dtype=np.single), 0.0, 1.0)
+    if invert:
+        values = 1.0 - values
+    if len(values) != len(dst_vcol.data):
+        # Per-vertex values into corner colors
+        loop_vert_idxs = np.empty(len(mesh.loops), dtype=np.intc)
+        mesh.loops.foreach_get('vertex_index', loop_vert_idxs)
+        values = values[loop_vert_idxs]
+
+    colors = np.empty(len(dst_vcol.data) * 4, dtype=np.single)
+    dst_vcol.data.foreach_get('color', colors)
+    colors[channel_idx::4] = values
+    dst_vcol.data.foreach_set('color', colors)
+
+def _find_nearest_distances(bvh, points, max_dist):
+    """Returns the distance to the nearest surface for each point, NaN if none within max_dist."""
+
+    # BVHTree has no batch query, this is still one call per point
+    find_nearest = bvh.find_nearest
+    dists = (find_nearest(co, max_dist)[3] for co in points.tolist())
+    return np.fromiter((np.nan if dist is None else dist for dist in dists),
+        dtype=np.double, count=len(points))
+
+def _get_cached(cache, key, build):
+    """Returns cache[key], building it first if needed. Without a cache, always builds."""
+
+    if cache is None:
+        return build()
+    if key not in cache:
+        cache[key] = build()
+    return cache[key]
+
+def _build_curve_bvh(src_obj, dg):
+    # Convert curve to a temporary mesh. Curve API is very limited, doing the math here
+    # would be a huge mess and likely slower. See https://blender.stackexchange.com/a/34276
+    src_mesh = src_obj.to_mesh(preserve_all_data_layers=False, depsgraph=dg)
+    bm = bmesh.new()
+    bm.from_mesh(src_mesh)
+    if not bm.faces:
+        bmesh.ops.extrude_edge_only(bm, edges=bm.edges)
+    bvh = BVHTree.FromBMesh(bm)
+    bm.free()
+    src_obj.to_mesh_clear()
+    return bvh
+
+def _build_curve_dist_along(src_obj, dg):
+    # To find the progress along the curve it would be enough to look at the generated UVs
+    # Again the API isn't very useful, so measure edge lengths to obtain distance instead
+    with SaveContext(bpy.context, 'get_distance_values') as save:
+        save.prop(src_obj.data, 'extrude bevel_depth', 0.0)
+        src_mesh = src_obj.to_mesh(preserve_all_data_layers=False, depsgraph=dg)
+    src_coords = np.empty(len(src_mesh.vertices) * 3, dtype=np.single)
+    src_mesh.vertices.foreach_get('co', src_coords)
+    src_coords = src_coords.reshape(-1, 3)
+    src_obj.to_mesh_clear()
+
+    # Cache sum of edge lengths up to each vertex
+    edge_lengths = np.linalg.norm(np.diff(src_coords, axis=0), axis=1)
+    dist_along = np.concatenate(([0.0], np.cumsum(edge_lengths)))
+
+    # Brute force is faster for short curves, past a few hundred points a tree wins
+    kd = None
+    if len(src_coords) > 512:
+        kd = KDTree(len(src_coords))
+        for vert_idx, co in enumerate(src_coords.tolist()):
+            kd.insert(co, vert_idx)
+        kd.balance()
+    return src_coords, dist_along, kd
 
-    for loop_idx, loop in enumerate(mesh.loops):
-        value = saturate(src_values[loop_idx if is_loops else loop.vertex_index])
-        if invert:
-            value = 1.0 - value
-        dst_vcol.data[loop_idx].color[channel_idx] = value
+def get_distance_values(obj, src_obj, extents=0.0, along_curve=False, cache=None):
+    """
+    Returns distance from each vertex to another object. Acceleration structures for the source
+    object are kept in cache if given, so they can be shared by many objects mapping to it.
+    """
 
-def get_distance_values(obj, src_obj, extents=0.0, along_curve=False):
     assert obj and src_obj
     mesh = obj.data
-    obj_to_src = src_obj.matrix_world.inverted() @ obj.matrix_world
+    obj_to_src = np.array(src_obj.matrix_world.inverted() @ obj.matrix_world)
     dg = bpy.context.evaluated_depsgraph_get()
     values = 0.0
 
+    # Vertex positions in source object space
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.single)
+    mesh.vertices.foreach_get('co', coords)
+    coords = coords.reshape(-1, 3) @ obj_to_src[:3, :3].T + obj_to_src[:3, 3]
+
     if src_obj.type == 'MESH':
-        bvh = BVHTree.FromObject(src_obj, dg)
+        bvh = _get_cached(cache, (src_obj.name, 'BVH'), lambda: BVHTree.FromObject(src_obj, dg))
 
         extents = max(extents, SMALL_NUMBER)
-        values = [1.0] * len(mesh.vertices)
-        for vert_idx, vert in enumerate(mesh.vertices):
-            loc, norm, index, dist = bvh.find_nearest(obj_to_src @ vert.co, extents)
-            if dist is not None:
-                values[vert_idx] = dist / extents
+        dists = _find_nearest_distances(bvh, coords, extents)
+        values = np.where(np.isnan(dists), 1.0, dists / extents)
 
     elif src_obj.type == 'CURVE' and not along_curve:
-        # Convert curve to a temporary mesh. Curve API is very limited, doing the math here
-        # would be a huge mess and likely slower. See https://blender.stackexchange.com/a/34276
-        src_mesh = src_obj.to_mesh(preserve_all_data_layers=False, depsgraph=dg)
-        bm = bmesh.new()
-        bm.from_mesh(src_mesh)
-        if not bm.faces:
-            bmesh.ops.extrude_edge_only(bm, edges=bm.edges)
-        bvh = BVHTree.FromBMesh(bm)
-        bm.free()
-        src_obj.to_mesh_clear()
+        bvh = _get_cached(cache, (src_obj.name, 'BVH'), lambda: _build_curve_bvh(src_obj, dg))
 
         extents = max(extents, SMALL_NUMBER)
-        values = [0.0] * len(mesh.vertices)
-        for vert_idx, vert in enumerate(mesh.vertices):
-            co, norm, index, dist = bvh.find_nearest(obj_to_src @ vert.co, extents)
-            if dist is not None:
-                values[vert_idx] = dist / extents
+        dists = _find_nearest_distances(bvh, coords, extents)
+        values = np.where(np.isnan(dists), 0.0, dists / extents)
 
     elif src_obj.type == 'CURVE' and along_curve:
-        # To find the progress along the curve it would be enough to look at the generated UVs
-        # Again the API isn't very useful, so measure edge lengths to obtain distance instead
-        with SaveContext(bpy.context, 'get_distance_values') as save:
-            save.prop(src_obj.data, 'extrude bevel_depth', 0.0)
-            src_mesh = src_obj.to_mesh(preserve_all_data_layers=False, depsgraph=dg)
-        src_verts = src_mesh.vertices
-        kd = KDTree(len(src_verts))
-        for vert_idx, vert in enumerate(src_verts):
-            kd.insert(vert.co, vert_idx)
-        kd.balance()
-
-        # Cache sum of edge lengths up to each vertex
-        dist_along = [0.0] * len(src_verts)
-        for vert_idx in range(1, len(src_verts)):
-            edge_length = get_dist(src_verts[vert_idx].co, src_verts[vert_idx - 1].co)
-            dist_along[vert_idx] = dist_along[vert_idx - 1] + edge_length
-        src_obj.to_mesh_clear()
+        src_coords, dist_along, kd = _get_cached(cache, (src_obj.name, 'ALONG_CURVE'),
+            lambda: _build_curve_dist_along(src_obj, dg))
         total_dist_along = dist_along[-1]
 
         if total_dist_along > 0.0:
             extents = extents if extents > 0.0 else total_dist_along
-            values = [0.0] * len(mesh.vertices)
-            for vert_idx, vert in enumerate(mesh.vertices):
-                co, index, dist = kd.find(obj_to_src @ vert.co)
-                values[vert_idx] = dist_along[index] / extents
+            if kd:
+                find = kd.find
+                nearest_idxs = np.fromiter((find(co)[1] for co in coords.tolist()),
+                    dtype=np.intp, count=len(coords))
+            else:
+                nearest_idxs, _ = find_nearest_points(coords, src_coords)
+            values = dist_along[nearest_idxs] / extents
 
     return values
 
@@ -134,47 +180,49 @@ def get_cavity_values(obj, valley_factor=1.0, ridge_factor=1.0, valley_only=Fals
     # Original code and method by Keith "Wahooney" Boshoff
     # See release/scripts/startup/bl_operators/vertexpaint_dirt.py
 
-    bm = bmesh.new()
-    bm.from_mesh(obj.data)
-
-    deform_layer = bm.verts.layers.deform.active
-    mask_vg_index = obj.vertex_groups.find(mask_vertex_group or "")
-    values = np.zeros(len(bm.verts))
-
-    for vert in bm.verts:
-        vec = Vector()
-        co = vert.co
-
-        # Get the direction of the vectors between the vertex and its connected vertices
-        for edge in vert.link_edges:
-            vec += (edge.other_vert(vert).co - co).normalized()
-        num_connected = len(vert.link_edges)
-        if num_connected == 0:
-            value = 0.5  # Assume flat
-        else:
-            vec /= num_connected
-            value = saturate(acos(vert.normal.dot(vec)) / pi)  # > 0.5 convex, < 0.5 concave
-
-        value = max(lerp(0.5, 0.25, valley_factor), value)
-        if not valley_only:
-            value = min(lerp(0.5, 0.75, ridge_factor), value)
-        values[vert.index] = value
+    mesh = obj.data
+    num_verts = len(mesh.vertices)
+    coords = np.empty(num_verts * 3, dtype=np.single)
+    mesh.vertices.foreach_get('co', coords)
+    coords = coords.reshape(-1, 3)
+    normals = np.empty(num_verts * 3, dtype=np.single)
+    mesh.vertices.foreach_get('normal', normals)
+    normals = normals.reshape(-1, 3)
+    edge_verts = np.empty(len(mesh.edges) * 2, dtype=np.intc)
+    mesh.edges.foreach_get('vertices', edge_verts)
+
+    # Edges in both directions act as a sparse adjacency matrix, used for every iteration below
+    edge_src = np.concatenate((edge_verts[0::2], edge_verts[1::2]))
+    edge_dst = np.concatenate((edge_verts[1::2], edge_verts[0::2]))
+    num_connected = np.bincount(edge_src, minlength=num_verts)
+    sum_neighbors = lambda x: np.bincount(edge_src, weights=x[edge_dst], minlength=num_verts)
+
+    # Get the direction of the vectors between the vertex and its connected vertices
+    edge_vecs = coords[edge_dst] - coords[edge_src]
+    edge_lengths = np.linalg.norm(edge_vecs, axis=1, keepdims=True)
+    edge_vecs = np.divide(edge_vecs, edge_lengths, out=np.zeros_like(edge_vecs), where=edge_lengths > 0.0)
+    vecs = np.stack([sum_neighbors(edge_vecs[:, axis]) for axis in range(3)], axis=1)
+    vecs /= np.maximum(num_connected, 1)[:, np.newaxis]
+    dots = np.clip(np.einsum('ij,ij->i', normals, vecs), -1.0, 1.0)
+    values = np.clip(np.arccos(dots) / pi, 0.0, 1.0)  # > 0.5 convex, < 0.5 concave
+    values[num_connected == 0] = 0.5  # Assume flat
+
+    values = np.maximum(lerp(0.5, 0.25, valley_factor), values)
+    if not valley_only:
+        values = np.minimum(lerp(0.5, 0.75, ridge_factor), values)
 
     # Blur values
-    vert_to_verts = [[e.other_vert(v).index for e in v.link_edges] for v in bm.verts]
+    blur_divisor = num_connected * blur_strength + 1
     for _ in range(blur_iterations):
-        orig_values = values.copy()
-        for idx, link_verts in enumerate(vert_to_verts):
-            for other_idx in link_verts:
-                values[idx] += blur_strength * orig_values[other_idx]
-            values[idx] /= len(link_verts) * blur_strength + 1
-        del orig_values
+        values = (values + blur_strength * sum_neighbors(values)) / blur_divisor
 
+    mask_vg_index = obj.vertex_groups.find(mask_vertex_group or "")
     if mask_vg_index >= 0:
+        weights = get_vertex_group_weights(obj, mask_vg_index)
         if invert_mask_vertex_group:
-            scale = [(1.0 - vert[deform_layer].get(mask_vg_index, 0.0)) * scale for vert in bm.verts]
+            scale = (1.0 - weights) * scale
         else:
-            scale = [vert[deform_layer].get(mask_vg_index, 0.0) * scale for vert in bm.verts]
+            scale = weights * scale
 
     values = 0.5 - (0.5 - values) * scale
     if valley_only:
@@ -182,13 +230,18 @@ def get_cavity_values(obj, valley_factor=1.0, ridge_factor=1.0, valley_only=Fals
 
     return values
 
-def get_vcol_values(obj, mapping, prefix, src_vcol, src_channel_idx):
+def get_vcol_values(obj, mapping, prefix, src_vcol, src_channel_idx, cache=None):
     mesh = obj.data
     src = getattr(mapping, prefix)
     values = 0.0
 
     if src == 'NONE':
-        values = [vcolloop.color[src_channel_idx] for vcolloop in src_vcol.data] if src_vcol else 1.0
+        if src_vcol:
+            colors = np.empty(len(src_vcol.data) * 4, dtype=np.single)
+            src_vcol.data.foreach_get('color', colors)
+            values = colors[src_channel_idx::4]
+        else:
+            values = 1.0
 
     if src == 'ZERO':
         values = 0.0
@@ -239,7 +292,7 @@ def get_vcol_values(obj, mapping, prefix, src_vcol, src_channel_idx):
         if src_obj:
             extents = getattr(mapping, prefix + '_extents')
             along_curve = getattr(mapping, prefix + '_along_curve')
-            values = get_distance_values(obj, src_obj, extents, along_curve)
+            values = get_distance_values(obj, src_obj, extents, along_curve, cache)
         else:
             values = 0.0
 
@@ -258,27 +311,108 @@ def get_vcol_values(obj, mapping, prefix, src_vcol, src_channel_idx):
 
     return values
 
-def update_vcol_from(obj, mapping, prefix, src_vcol, dst_vcol, channel_idx, invert=False):
-    values = get_vcol_values(obj, mapping, prefix, src_vcol, channel_idx)
+def _hash_mesh(mesh, topology=False):
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.single)
+    mesh.vertices.foreach_get('co', coords)
+    h = hashlib.blake2b(coords.tobytes(), digest_size=16)
+    if topology:
+        edge_verts = np.empty(len(mesh.edges) * 2, dtype=np.intc)
+        mesh.edges.foreach_get('vertices', edge_verts)
+        h.update(edge_verts.tobytes())
+    return h.hexdigest()
+
+def _hash_vcol_channels(vcol):
+    colors = np.empty(len(vcol.data) * 4, dtype=np.single)
+    vcol.data.foreach_get('color', colors)
+    return [hashlib.blake2b(colors[channel_idx::4].tobytes(), digest_size=16).hexdigest()
+        for channel_idx in range(4)]
+
+def _hash_evaluated_mesh(obj):
+    dg = bpy.context.evaluated_depsgraph_get()
+    obj_eval = obj.evaluated_get(dg)
+    mesh_hash = _hash_mesh(obj_eval.to_mesh(), True)
+    obj_eval.to_mesh_clear()
+    return mesh_hash
+
+def get_channel_fingerprint(obj, mapping, prefix, invert=False, cache=None):
+    """Hashes the inputs of a mapped channel. Returns an empty string if they can't be tracked."""
+
+    src = getattr(mapping, prefix)
+    if src in {'NONE', 'VERTEX_GROUP', 'BEVEL'}:
+        # Reading these inputs costs as much as refreshing the channel
+        return ""
+    inputs = [src, invert] + [getattr(mapping, f'{prefix}_{suffix}') for suffix in channel_property_suffixes]
+
+    if src == 'HASH':
+        inputs.append(obj.name)
+    elif src in {'PIVOTLOC', 'PIVOTROT'}:
+        inputs += [tuple(obj.location), tuple(obj.rotation_euler)]
+    elif src in {'VERTEX', 'DISTANCE', 'CAVITY'}:
+        if src == 'CAVITY' and obj.vertex_groups.get(getattr(mapping, prefix + '_vertex_group')):
+            return ""
+        topology = src == 'CAVITY'
+        inputs += [[tuple(row) for row in obj.matrix_world],
+            _get_cached(cache, (obj.name, 'DATA_HASH', topology), lambda: _hash_mesh(obj.data, topology))]
+
+    if src == 'DISTANCE':
+        src_obj = bpy.data.objects.get(getattr(mapping, prefix + '_object'))
+        if src_obj:
+            inputs += [[tuple(row) for row in src_obj.matrix_world],
+                _get_cached(cache, (src_obj.name, 'HASH'), lambda: _hash_evaluated_mesh(src_obj))]
+
+    return hashlib.blake2b(repr(inputs).encode(), digest_size=16).hexdigest()
+
+def update_vcol_from(obj, mapping, prefix, src_vcol, dst_vcol, channel_idx, invert=False, cache=None):
+    values = get_vcol_values(obj, mapping, prefix, src_vcol, channel_idx, cache)
     invert = invert != getattr(mapping, prefix + '_invert')
     values_to_vcol(obj.data, values, dst_vcol, channel_idx, invert=invert)
 
-def update_vcols(obj, invert=False):
+def update_vcols(obj, invert=False, only_stale=False, cache=None):
+    """
+    Refreshes mapped vertex colors. Returns the number of channels that were recomputed.
+    Pass the same cache dict when refreshing many objects to share source data between them.
+    """
+
     mapping = get_first_mapping(obj)
     if not mapping:
-        return
+        return 0
+    if cache is None:
+        cache = {}  # Still share data between the channels of this object
 
     # TODO don't force domain
     vcol = get_vcolor(obj, mapping.vertex_color_layer_name, domain='CORNER')
     invert = invert != mapping.invert
-    update_vcol_from(obj, mapping, 'r', vcol, vcol, 0, invert)
-    update_vcol_from(obj, mapping, 'g', vcol, vcol, 1, invert)
-    update_vcol_from(obj, mapping, 'b', vcol, vcol, 2, invert)
-    update_vcol_from(obj, mapping, 'a', vcol, vcol, 3, invert)
+    fingerprints = {}
+    if only_stale:
+        channel_hashes = _hash_vcol_channels(vcol)
+    updated_channels = []
+    for channel_idx, prefix in enumerate(('r', 'g', 'b', 'a')):
+        if only_stale:
+            # Fingerprint includes the written result, in case the layer was edited or replaced
+            fingerprint = get_channel_fingerprint(obj, mapping, prefix, invert, cache)
+            if (fingerprint and getattr(mapping, prefix + '_fingerprint')
+                == fingerprint + channel_hashes[channel_idx]):
+                continue
+            fingerprints[prefix] = fingerprint
+
+        update_vcol_from(obj, mapping, prefix, vcol, vcol, channel_idx, invert, cache)
+        updated_channels.append((channel_idx, prefix))
+
+    if not updated_channels:
+        return 0
+
+    # Fingerprints are only tracked when skipping, otherwise cleared so that they're never stale
+    if any(fingerprints.values()):
+        channel_hashes = _hash_vcol_channels(vcol)
+    for channel_idx, prefix in updated_channels:
+        fingerprint = fingerprints.get(prefix)
+        setattr(mapping, prefix + '_fingerprint',
+            fingerprint + channel_hashes[channel_idx] if fingerprint else "")
     obj.data.update()
+    return len(updated_channels)
 
 class GRET_OT_vertex_color_mapping_refresh(bpy.types.Operator):
-    """Creates or refreshes the active vertex color layer from source mappings"""
+    """Creates or refreshes the vertex color layer of selected objects from source mappings"""
 
     bl_idname = 'gret.vertex_color_mapping_refresh'
     bl_label = "Refresh Vertex Color Mapping"
@@ -289,15 +423,26 @@ class GRET_OT_vertex_color_mapping_refresh(bpy.types.Operator):
         description="Invert the result",
         default=False,
     )
+    only_stale: bpy.props.BoolProperty(
+        name="Only Changed",
+        description="Skip channels whose inputs haven't changed since they were last refreshed",
+        default=False,
+    )
 
     @classmethod
     def poll(cls, context):
         return context.active_object and context.active_object.type == 'MESH'
 
     def execute(self, context):
-        obj = context.active_object
-        if obj.vertex_color_mapping:
-            update_vcols(obj, invert=self.invert)
+        objs = [context.active_object] + [o for o in context.selected_objects
+            if o != context.active_object and o.type == 'MESH']
+
+        # Source objects are shared by all targets, build their BVH trees once for the whole batch
+        cache = {}
+        for obj in objs:
+            if obj.vertex_color_mapping:
+                update_vcols(obj, invert=self.invert, only_stale=self.only_stale, cache=cache)
+        cache.clear()
 
         return {'FINISHED'}
 
@@ -681,6 +826,26 @@ class GRET_PG_vertex_color_mapping(bpy.types.PropertyGroup):
         description="Contrast increase",
         default=1.0, soft_min=0.0, soft_max=10.0,
     )
+    r_fingerprint: bpy.props.StringProperty(
+        name="Fingerprint",
+        description="Hash of the inputs and result of the last refresh",
+        options={'HIDDEN'},
+    )
+    g_fingerprint: bpy.props.StringProperty(
+        name="Fingerprint",
+        description="Hash of the inputs and result of the last refresh",
+        options={'HIDDEN'},
+    )
+    b_fingerprint: bpy.props.StringProperty(
+        name="Fingerprint",
+        description="Hash of the inputs and result of the last refresh",
+        options={'HIDDEN'},
+    )
+    a_fingerprint: bpy.props.StringProperty(
+        name="Fingerprint",
+        description="Hash of the inputs and result of the last refresh",
+        options={'HIDDEN'},
+    )
 
 def vcol_panel_draw(self, context):
     layout = self.layout
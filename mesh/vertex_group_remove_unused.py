@@ -1,4 +1,5 @@
 import bpy
+import numpy as np
 
 from ..helpers import flip_name
 
@@ -19,26 +20,29 @@ class GRET_OT_vertex_group_remove_unused(bpy.types.Operator):
         obj.update_from_editmode()
         vgroups = obj.vertex_groups
 
-        vg_idx_used = {vg_idx: vg.lock_weight for vg_idx, vg in enumerate(vgroups)}
+        vg_used = np.fromiter((vg.lock_weight for vg in vgroups), dtype=bool, count=len(vgroups))
 
-        for vert in obj.data.vertices:
-            for vg in vert.groups:
-                if vg.weight > 0.0:
-                    vg_idx_used[vg.group] = True
+        # Gather the groups of every nonzero weight in a single pass
+        vg_idxs = np.fromiter((vg.group for vert in obj.data.vertices for vg in vert.groups
+            if vg.weight > 0.0), dtype=np.int32)
+        vg_used[np.unique(vg_idxs)] = True
 
         if any(mod.type == 'MIRROR' and mod.use_mirror_vertex_groups for mod in obj.modifiers):
             # Mark mirror vertex groups as used
-            for vg_idx, used in vg_idx_used.items():
-                if used:
-                    flipped_name = flip_name(vgroups[vg_idx].name)
-                    if flipped_name:
-                        other_vg_idx = vgroups.find(flipped_name)
-                        if other_vg_idx >= 0:
-                            vg_idx_used[other_vg_idx] = True
+            for vg_idx in np.flatnonzero(vg_used).tolist():
+                flipped_name = flip_name(vgroups[vg_idx].name)
+                if flipped_name:
+                    other_vg_idx = vgroups.find(flipped_name)
+                    if other_vg_idx >= 0:
+                        vg_used[other_vg_idx] = True
 
         # Delete in reverse to not upset the indices
-        for vg_idx in sorted((vg_idx for vg_idx, used in vg_idx_used.items() if not used), reverse=True):
-            vgroups.remove(vgroups[vg_idx])
+        unused_vgroups = [vgroups[vg_idx] for vg_idx in np.flatnonzero(~vg_used)[::-1].tolist()]
+        if len(unused_vgroups) == len(vgroups):
+            vgroups.clear()
+        else:
+            for vgroup in unused_vgroups:
+                vgroups.remove(vgroup)
 
         return {'FINISHED'}
 
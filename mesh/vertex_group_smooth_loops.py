@@ -1,8 +1,9 @@
 from collections import defaultdict, namedtuple
 import bmesh
 import bpy
+import numpy as np
 
-from .helpers import bmesh_vertex_group_bleed, get_operator_target_vertex_groups
+from .helpers import get_operator_target_vertex_groups, set_vertex_group_weights
 
 class EdgeKey(namedtuple("EdgeKey", ['a', 'b'])):
     __slots__ = ()
@@ -67,6 +68,7 @@ def get_connected_selections(edge_keys):
     loops = []
     while len(vert_verts) > 0:
         loop = [iter(vert_verts.keys()).__next__()]
+        loop_verts = set(loop)
         growing = True
         flipped = False
 
@@ -82,7 +84,7 @@ def get_connected_selections(edge_keys):
             else:
                 extended = False
                 for i, next_vert in enumerate(vert_verts[loop[-1]]):
-                    if next_vert not in loop:
+                    if next_vert not in loop_verts:
                         vert_verts[loop[-1]].pop(i)
                         if len(vert_verts[loop[-1]]) == 0:
                             del vert_verts[loop[-1]]
@@ -93,6 +95,7 @@ def get_connected_selections(edge_keys):
                             else:
                                 vert_verts[next_vert].remove(loop[-1])
                         loop.append(next_vert)
+                        loop_verts.add(next_vert)
                         extended = True
                         break
                 if not extended:
@@ -147,12 +150,9 @@ def get_parallel_loops(bm, loops):
         # Initialise with original loop
         all_edgeloops.append(loop[0])
         newloops = [loop[0]]
-        verts_used = []
+        verts_used = set()
         for edge in loop[0]:
-            if edge[0] not in verts_used:
-                verts_used.append(edge[0])
-            if edge[1] not in verts_used:
-                verts_used.append(edge[1])
+            verts_used.update(edge)
 
         # Find parallel loops
         while len(newloops) > 0:
@@ -206,9 +206,7 @@ def get_parallel_loops(bm, loops):
                             break
                 if extraloop:
                     for key in extraloop:
-                        for new_vert in key:
-                            if new_vert not in verts_used:
-                                verts_used.append(new_vert)
+                        verts_used.update(key)
                     newloops.append(extraloop)
                     all_edgeloops.append(extraloop)
 
@@ -246,6 +244,28 @@ def get_parallel_loops(bm, loops):
             loops.append([loop, circular])
     return loops
 
+def bleed_loop_weights(weights, coords, circular, distance):
+    """
+    Bleeds weights along an ordered loop of vertices. Each weight becomes the highest of the loop's
+    weights minus their distance along the loop, divided by the given distance.
+    """
+
+    num_verts = len(weights)
+    if circular:
+        # Unroll three times, the middle copy then sees every vertex in both directions
+        seg_lengths = np.linalg.norm(np.roll(coords, -1, axis=0) - coords, axis=1)
+        seg_lengths = np.tile(seg_lengths, 3)[:-1]
+        weights = np.tile(weights, 3)
+    else:
+        seg_lengths = np.linalg.norm(np.diff(coords, axis=0), axis=1)
+    offsets = np.concatenate(((0.0,), np.cumsum(seg_lengths))) / distance
+
+    # Best weight arriving from either side, as a running maximum
+    forward = np.maximum.accumulate(weights + offsets) - offsets
+    backward = np.maximum.accumulate((weights - offsets)[::-1])[::-1] + offsets
+    weights = np.maximum(forward, backward)
+    return weights[num_verts:num_verts*2] if circular else weights
+
 class GRET_OT_vertex_group_smooth_loops(bpy.types.Operator):
     """Smooth weights for selected vertex loops"""
 
@@ -310,17 +330,36 @@ class GRET_OT_vertex_group_smooth_loops(bpy.types.Operator):
         bm.verts.ensure_lookup_table()
         bm.faces.ensure_lookup_table()
 
-        loops = get_connected_input(bm, parallel=self.input_mode=='ALL')
-        for vert_idxs, circular in loops:
-            for vert in bm.verts:
-                vert.tag = False
-            for vert_idx in vert_idxs:
-                bm.verts[vert_idx].tag = True
-            for vg_idx in vg_idxs:
-                bmesh_vertex_group_bleed(bm, vg_idx, distance=self.distance, power=self.power,
-                    only_tagged=True)
-
-        bm.to_mesh(obj.data)
+        loops = [(np.array(vert_idxs), circular) for vert_idxs, circular
+            in get_connected_input(bm, parallel=self.input_mode=='ALL')]
+        if not loops or self.distance <= 0.0:
+            bm.free()
+            return {'FINISHED'}
+
+        loop_vert_idxs = np.unique(np.concatenate([vert_idxs for vert_idxs, _ in loops]))
+        coords = np.empty(len(obj.data.vertices) * 3, dtype=np.single)
+        obj.data.vertices.foreach_get('co', coords)
+        coords.shape = (-1, 3)
+        deform_layer = bm.verts.layers.deform.active
+
+        for vg_idx in vg_idxs:
+            # Read the current weights of loop vertices, bleeding works on weights raised to power
+            weights = np.zeros(len(bm.verts))
+            if deform_layer:
+                weights[loop_vert_idxs] = [bm.verts[vert_idx][deform_layer].get(vg_idx, 0.0)
+                    for vert_idx in loop_vert_idxs.tolist()]
+            old_weights = weights ** self.power
+            new_weights = old_weights.copy()
+            for vert_idxs, circular in loops:
+                new_weights[vert_idxs] = bleed_loop_weights(new_weights[vert_idxs], coords[vert_idxs],
+                    circular, self.distance)
+
+            changed_mask = new_weights[loop_vert_idxs] > old_weights[loop_vert_idxs] + 1e-6
+            changed_idxs = loop_vert_idxs[changed_mask]
+            if len(changed_idxs):
+                set_vertex_group_weights(obj.vertex_groups[vg_idx],
+                    new_weights[changed_idxs] ** (1.0 / self.power), changed_idxs)
+
         bm.free()
         context.area.tag_redraw()
 